@@ -0,0 +1,87 @@
+import json, sqlite3, shutil, statistics
+from queue import Queue
+from os.path import realpath, isfile, dirname
+from argparse import ArgumentParser
+from time import perf_counter
+
+from reposcanner import prepare_custom_lint_shell_dir, lint_rule_fingerprints, run_analyzer, run_analyzer_daemon, build_lint_daemon, LintDaemon, create_workspace, remove_workspace, setup_analyzer
+
+
+def report(name: str, latencies: list[float]):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name}: n={len(latencies)} mean={statistics.mean(latencies):.2f}s median={statistics.median(latencies):.2f}s p95={p95:.2f}s total={sum(latencies):.2f}s")
+
+def main():
+    argparser = ArgumentParser(description="compare per-app latency of `dart run custom_lint` per app against the lint daemon, both with all lint rules, and check that they report the same findings")
+    argparser.add_argument("config")
+    argparser.add_argument("-l", "--limit", type=int, default=10, help="number of already analyzed apps to analyze again, ordered by github_stars")
+    args = argparser.parse_args()
+
+    with open(args.config) as f:
+        config = {k: realpath(v, strict=True) for k, v in json.load(f).items()}
+    config["thesis_lints_dir"] = realpath(f"{dirname(__file__)}/thesis_lints", strict=True)
+    connection = sqlite3.connect(config["database"])
+    connection.row_factory = sqlite3.Row
+
+    apps = [
+        app for app in connection.execute("SELECT * FROM app WHERE analyzed ORDER BY github_stars DESC").fetchall()
+        if isfile(f"{config['repos_dir']}/{app['id']}/{app['pubspec_path']}")
+    ][:args.limit]
+    connection.close()
+    shell_dir = prepare_custom_lint_shell_dir(config["thesis_lints_dir"], config["flutter_3_27_0"])
+    # both paths get all rules, lowercased like the diagnostic codes
+    lint_rules = {rule.lower() for rule in lint_rule_fingerprints(config["thesis_lints_dir"], shell_dir, config["flutter_3_27_0"])}
+    # one workspace per app set up before measuring, so that both paths analyze the same resolved packages
+    workspaces = {}
+    for app in apps:
+        workspace_dir = create_workspace(f"{config['repos_dir']}/{app['id']}", f"{config['repos_dir']}/.workspaces", app)
+        try:
+            setup_analyzer(app, workspace_dir, config["flutter_3_7_12"], config["flutter_3_27_0"], None, f"{config['repos_dir']}/.resolutions")
+            workspaces[app["id"]] = workspace_dir
+        except Exception as e:
+            print(f"failed to setup app {app['id']}: {e}")
+            remove_workspace(workspace_dir)
+    apps = [app for app in apps if app["id"] in workspaces]
+
+    cold_latencies = []
+    cold_findings = {}
+    for app in apps:
+        start = perf_counter()
+        cold_findings[app["id"]] = run_analyzer(app, shell_dir, workspaces[app["id"]], config["flutter_3_27_0"], lint_rules)
+        cold_latencies.append(perf_counter() - start)
+
+    build_lint_daemon(shell_dir, config["flutter_3_27_0"])
+    start = perf_counter()
+    daemons = Queue()
+    daemons.put(LintDaemon(shell_dir, config["flutter_3_27_0"]))
+    daemon_latencies = []
+    daemon_findings = {}
+    for app in apps:
+        daemon_findings[app["id"]] = run_analyzer_daemon(app, daemons, workspaces[app["id"]], lint_rules)
+        daemon_latencies.append(perf_counter() - start)
+        start = perf_counter()
+    daemons.get().close()
+    shutil.rmtree(shell_dir)
+    for workspace_dir in workspaces.values():
+        remove_workspace(workspace_dir)
+
+    report("custom_lint per app", cold_latencies)
+    # the first daemon request includes process startup and plugin compilation
+    report("lint daemon", daemon_latencies)
+    if len(daemon_latencies) > 1:
+        report("lint daemon (warm)", daemon_latencies[1:])
+
+    # the daemon runs the rules with testRun and applies ignore comments itself, its findings have to match custom_lint's
+    mismatches = 0
+    for app in apps:
+        cold, daemon = sorted(cold_findings[app["id"]]), sorted(daemon_findings[app["id"]])
+        if cold != daemon:
+            mismatches += 1
+            print(f"app {app['id']} {app['github_repo']}: custom_lint {len(cold)} findings, daemon {len(daemon)}, "
+                  f"only custom_lint: {[finding for finding in cold if finding not in daemon][:3]}, only daemon: {[finding for finding in daemon if finding not in cold][:3]}")
+    assert not mismatches, f"custom_lint and the lint daemon differ for {mismatches} of {len(apps)} apps"
+    print(f"custom_lint and the lint daemon report the same {sum(map(len, cold_findings.values()))} findings")
+
+if __name__ == "__main__":
+    main()
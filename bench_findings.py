@@ -0,0 +1,106 @@
+import json, sqlite3, tempfile, random
+from os.path import dirname, getsize
+from argparse import ArgumentParser
+from time import perf_counter
+
+from reposcanner import transaction, load_lint_rule_ids, save_findings, compact_finding
+
+NEW_INDEXES = ("finding_app_lint_rule", "finding_lint_rule", "finding_file_line", "lint_rule_name_nocase", "api_lint_rule")
+
+
+def create_db(path: str, rules: int, apps: int, previous: bool):
+    connection = sqlite3.connect(path, autocommit=True)
+    connection.row_factory = sqlite3.Row
+    with open(f"{dirname(__file__) or '.'}/create_db.sql") as f:
+        connection.executescript(f.read())
+    # the previous schema: no indexes and the location as indented JSON text
+    if previous:
+        for index in NEW_INDEXES:
+            connection.execute(f'DROP INDEX "{index}"')
+        connection.execute('ALTER TABLE finding ADD COLUMN "location" TEXT')
+    connection.executemany("INSERT INTO lint_rule (name) VALUES (?)", [(f"Rule_{i}",) for i in range(rules)])
+    connection.executemany(
+        "INSERT INTO app (package_id, github_name, github_repo, github_stars, path, pubspec_path) VALUES (?, ?, ?, ?, '.', 'pubspec.yaml')",
+        [(f"com.example.app{i}", f"app{i}", f"https://github.com/example/app{i}", i) for i in range(apps)]
+    )
+    return connection
+
+def synthetic_findings(app_id: int, count: int, rules: int):
+    random.seed(app_id)
+    return [{
+        "code": f"rule_{random.randrange(rules)}",
+        "problemMessage": "Usage of a dangerous API",
+        "location": {"file": f"/repos/{app_id}/lib/src/file_{i % 50}.dart", "range": {"start": {"offset": i * 40, "line": i, "column": 3}, "end": {"offset": i * 40 + 12, "line": i, "column": 15}}},
+    } for i in range(count)]
+
+# the previous writer: every statement its own autocommit transaction and a correlated rule lookup per finding
+def save_findings_per_statement(connection: sqlite3.Connection, app_id: int, findings: list[dict], lint_rules: list[str]):
+    connection.execute(f"""
+        DELETE FROM finding WHERE app = ? AND vulnerable IS NULL AND lint_rule IN (
+            SELECT id FROM lint_rule WHERE lower(name) IN ({','.join('?' * len(lint_rules))})
+        )
+        """,
+        (app_id, *lint_rules)
+    )
+    connection.executemany("""
+        INSERT INTO finding (description, location, app, lint_rule) VALUES (
+            ?, ?, ?,
+            (SELECT id FROM lint_rule WHERE lint_rule.name = ? COLLATE NOCASE)
+        )
+        """,
+        [(finding["problemMessage"], json.dumps(finding["location"], indent=4), app_id, finding["code"]) for finding in findings if finding["code"] in lint_rules]
+    )
+    connection.execute("UPDATE app SET analyzed = TRUE WHERE id = ?", (app_id,))
+
+def main():
+    argparser = ArgumentParser(description="benchmark the findings writer of reposcanner.py on a synthetic load")
+    argparser.add_argument("-n", "--findings", type=int, default=1_000_000)
+    argparser.add_argument("-a", "--apps", type=int, default=1000)
+    argparser.add_argument("-r", "--rules", type=int, default=40)
+    argparser.add_argument("--baseline-apps", type=int, default=20, help="apps written with the old per-statement writer, its throughput is extrapolated")
+    args = argparser.parse_args()
+
+    per_app = args.findings // args.apps
+    lint_rules = [f"rule_{i}" for i in range(args.rules)]
+    fingerprints = {f"Rule_{i}": "fingerprint" for i in range(args.rules)}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        connection = create_db(f"{tmp_dir}/baseline.db", args.rules, args.apps, previous=True)
+        start = perf_counter()
+        for app_id in range(1, args.baseline_apps + 1):
+            save_findings_per_statement(connection, app_id, synthetic_findings(app_id, per_app, args.rules), lint_rules)
+        baseline = perf_counter() - start
+        connection.execute("VACUUM")
+        connection.close()
+        baseline_size = getsize(f"{tmp_dir}/baseline.db")
+
+        connection = create_db(f"{tmp_dir}/writer.db", args.rules, args.apps, previous=False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        lint_rule_ids = load_lint_rule_ids(connection)
+        apps = connection.execute("SELECT * FROM app ORDER BY id").fetchall()
+        findings = {app["id"]: [compact_finding(finding) for finding in synthetic_findings(app["id"], per_app, args.rules)] for app in apps}
+        start = perf_counter()
+        for app in apps:
+            with transaction(connection):
+                save_findings(connection, app, findings[app["id"]], fingerprints, lint_rule_ids)
+        writer = perf_counter() - start
+        written = connection.execute("SELECT count(*) FROM finding").fetchone()[0]
+
+        # second pass: every app reanalyzed, the per-app delete has to find the old findings
+        start = perf_counter()
+        for app in apps:
+            with transaction(connection):
+                save_findings(connection, app, findings[app["id"]], fingerprints, lint_rule_ids)
+        rewrite = perf_counter() - start
+        connection.execute("VACUUM")
+        connection.close()
+        writer_size = getsize(f"{tmp_dir}/writer.db")
+
+    baseline_rate = args.baseline_apps * per_app / baseline
+    print(f"per-statement writer: {args.baseline_apps * per_app} findings in {baseline:.2f}s, {baseline_rate:,.0f} findings/s (extrapolated {args.findings / baseline_rate:.0f}s for {args.findings:,})")
+    print(f"transaction writer: {written:,} findings in {writer:.2f}s, {written / writer:,.0f} findings/s")
+    print(f"transaction writer, reanalysis with delete: {rewrite:.2f}s, {written / rewrite:,.0f} findings/s")
+    print(f"database size per finding: JSON location {baseline_size / (args.baseline_apps * per_app):.0f} bytes, compact location {writer_size / written:.0f} bytes")
+
+if __name__ == "__main__":
+    main()
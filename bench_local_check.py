@@ -0,0 +1,104 @@
+import os, hashlib, tempfile
+from argparse import ArgumentParser
+from subprocess import check_output
+from time import perf_counter
+from types import SimpleNamespace
+
+import fetch_repo
+from fetch_repo import MyRepository, RepoInfo, check_flutter_repo, filter_repo
+
+FLUTTER_PUBSPEC = b"name: app\ndependencies:\n  flutter:\n    sdk: flutter\n"
+DART_PUBSPEC = b"name: package\ndependencies:\n  path: ^1.8.0\n"
+MAIN_MANIFEST = b'<manifest><application><activity><intent-filter><action android:name="android.intent.action.MAIN" /></intent-filter></activity></application></manifest>\n'
+LIBRARY_MANIFEST = b'<manifest package="org.fixture.library" />\n'
+
+def gradle(application_id: str):
+    return f'android {{ defaultConfig {{ applicationId "{application_id}" }} }}\n'.encode()
+
+def app_files(path: str, application_id: str):
+    prefix = f"{path}/" if path else ""
+    return {
+        f"{prefix}pubspec.yaml": FLUTTER_PUBSPEC,
+        f"{prefix}android/app/src/main/AndroidManifest.xml": MAIN_MANIFEST,
+        f"{prefix}android/app/src/debug/AndroidManifest.xml": LIBRARY_MANIFEST,
+        f"{prefix}android/app/build.gradle": gradle(application_id),
+        f"{prefix}lib/main.dart": b"void main() {}\n",
+    }
+
+# the layouts check and filter tell apart: root app, apps nested in a monorepo, plugin with example app, plain dart package, no app at all
+FIXTURES = {
+    "fixture/root_app": app_files("", "org.fixture.root"),
+    "fixture/monorepo": app_files("packages/apps/shop", "org.fixture.shop") | app_files("packages/apps/admin", "org.fixture.admin") | {"packages/core/pubspec.yaml": DART_PUBSPEC},
+    "fixture/nested_app": app_files("packages/apps/shop", "org.fixture.nested") | {"packages/apps/shop/assets/build.gradle": b"\0binary\0"},
+    "fixture/plugin": {"pubspec.yaml": FLUTTER_PUBSPEC, "android/build.gradle": b"apply plugin: 'com.android.library'\n", "android/src/main/AndroidManifest.xml": LIBRARY_MANIFEST} | app_files("example", "org.fixture.plugin_example"),
+    "fixture/dart_package": {"pubspec.yaml": DART_PUBSPEC, "lib/package.dart": b"void f() {}\n"},
+    "fixture/kotlin_dsl": app_files("app", "unused") | {"app/android/app/build.gradle.kts": b'android { defaultConfig { applicationId = "org.fixture.kts" } }\n'},
+}
+
+def blob_sha(content: bytes):
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+class StubGitHub:
+    # serves the fixture files the way fetch_git_tree and fetch_blobs read them from the API: recursive tree and GraphQL blob batches
+    def __init__(self, fixtures: dict[str, dict[str, bytes]]):
+        self.trees = {name: {path: (blob_sha(content), content) for path, content in files.items()} for name, files in fixtures.items()}
+        self.requester = SimpleNamespace(graphql_query=self.graphql_query)
+
+    def get_repo(self, full_name: str, lazy: bool = False):
+        tree = self.trees[full_name]
+        blobs = {sha: content for sha, content in tree.values()}
+        return SimpleNamespace(
+            get_git_tree=lambda branch, recursive: SimpleNamespace(tree=[SimpleNamespace(path=path, type="blob", sha=sha) for path, (sha, _) in tree.items()]),
+            get_git_blob=lambda sha: SimpleNamespace(content=blobs[sha]),
+        )
+
+    def graphql_query(self, query: str, variables: dict):
+        blobs = {sha: content for sha, content in self.trees[f"{variables['owner']}/{variables['name']}"].values()}
+        result = {}
+        for key, sha in variables.items():
+            if key.startswith("oid"):
+                content = blobs[sha]
+                binary = b"\0" in content
+                result[f"b{key[3:]}"] = {"text": None if binary else content.decode(), "isBinary": binary, "isTruncated": False}
+        return {}, {"data": {"repository": result}}
+
+def create_clones(local_dir: str):
+    # bare clones in the <local_dir>/<owner>/<name>.git layout of `check --local`
+    for full_name, files in FIXTURES.items():
+        work_tree = f"{local_dir}/work/{full_name}"
+        for path, content in files.items():
+            os.makedirs(os.path.dirname(f"{work_tree}/{path}"), exist_ok=True)
+            with open(f"{work_tree}/{path}", "wb") as f:
+                f.write(content)
+        git_dir = f"{local_dir}/{full_name}.git"
+        check_output(["git", "init", "--quiet", "--bare", "--initial-branch=main", git_dir])
+        git = ["git", f"--git-dir={git_dir}", f"--work-tree={work_tree}", "-c", "user.name=bench", "-c", "user.email=bench@localhost"]
+        check_output(git + ["add", "--all"])
+        check_output(git + ["commit", "--quiet", "-m", "fixture"])
+
+def detect(full_name: str, local_dir: str = None):
+    repo = MyRepository(RepoInfo(full_name, f"https://github.com/{full_name}", 100, None, "main"))
+    start = perf_counter()
+    check_flutter_repo(repo, local_dir)
+    apps = sorted((app.path, app.pubspec.path, app.android_manifest.path) for app in repo.apps)
+    kept = filter_repo(repo) is not None
+    return perf_counter() - start, repo.is_flutter, apps, kept, sorted((app.path, app.app_identifier) for app in repo.apps)
+
+def main():
+    argparser = ArgumentParser(description="checks that `check --local` detects the same apps from bare clones as the API path does from a stub GitHub API serving the same fixture repos")
+    argparser.add_argument("-r", "--rounds", type=int, default=5, help="timed local detections per repo")
+    args = argparser.parse_args()
+
+    fetch_repo.G = StubGitHub(FIXTURES)
+    with tempfile.TemporaryDirectory() as local_dir:
+        create_clones(local_dir)
+        for full_name in FIXTURES:
+            api = detect(full_name)
+            local = [detect(full_name, local_dir) for _ in range(args.rounds)]
+            assert api[1:] == local[0][1:], f"{full_name}: API {api[1:]} != local {local[0][1:]}"
+            _, is_flutter, apps, kept, identifiers = local[0]
+            print(f"{full_name}: flutter {is_flutter}, {len(apps)} apps, kept {kept} {identifiers}, local detection {min(t for t, *_ in local) * 1000:.1f}ms")
+    print("local and API detection agree")
+
+if __name__ == "__main__":
+    main()
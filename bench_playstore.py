@@ -0,0 +1,57 @@
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import perf_counter
+
+from fetch_repo import parse_playstore_page, parse_playstore_page_soup
+
+
+def parse_or_none(parser, page: str):
+    try:
+        return parser(page)
+    except Exception:
+        return None
+
+def parse_soup(page: str):
+    return parse_or_none(parse_playstore_page_soup, page)
+
+def parse_targeted(page: str):
+    return parse_or_none(parse_playstore_page, page)
+
+def main():
+    argparser = ArgumentParser(description="benchmark the Play Store page parsers offline on saved app pages, e.g. `curl -o com.example.app.html 'https://play.google.com/store/apps/details?id=com.example.app'`")
+    argparser.add_argument("pages", help="directory of saved Play Store app pages (*.html)")
+    argparser.add_argument("-p", "--processes", type=int, default=os.cpu_count())
+    argparser.add_argument("-r", "--repeat", type=int, default=1, help="parse every page this many times")
+    args = argparser.parse_args()
+
+    pages = []
+    for name in sorted(os.listdir(args.pages)):
+        if name.endswith(".html"):
+            with open(f"{args.pages}/{name}", encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+    pages *= args.repeat
+    print(f"pages: {len(pages)} ({sum(map(len, pages)) / (1 << 20):.1f} MiB)")
+
+    start = perf_counter()
+    soup_results = [parse_soup(page) for page in pages]
+    soup = perf_counter() - start
+    start = perf_counter()
+    targeted_results = [parse_targeted(page) for page in pages]
+    targeted = perf_counter() - start
+    with ProcessPoolExecutor(args.processes, mp_context=get_context("forkserver")) as executor:
+        # warm up the workers, so that process startup isn't measured
+        list(executor.map(parse_targeted, pages[:args.processes]))
+        start = perf_counter()
+        pool_results = list(executor.map(parse_targeted, pages, chunksize=max(1, len(pages) // (args.processes * 4))))
+        pool = perf_counter() - start
+    assert pool_results == targeted_results
+
+    print(f"BeautifulSoup full text: {soup:.2f}s, {len(pages) / soup:,.1f} pages/s, parsed {sum(1 for result in soup_results if result)}")
+    print(f"targeted parser: {targeted:.2f}s, {len(pages) / targeted:,.1f} pages/s, parsed {sum(1 for result in targeted_results if result)}")
+    print(f"targeted parser, {args.processes} processes: {pool:.2f}s, {len(pages) / pool:,.1f} pages/s")
+    print(f"same result as BeautifulSoup: {sum(1 for a, b in zip(soup_results, targeted_results) if a == b)}/{len(pages)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os, re, random
+from argparse import ArgumentParser
+from copy import deepcopy
+from time import perf_counter
+
+from fetch_repo import MyRepository, MyFile, MyApp, FLUTTER_SDK_PATTERN, check_flutter_repo, filter_repo
+
+FLUTTER_PUBSPEC = b"name: app\ndependencies:\n  flutter:\n    sdk: flutter\n"
+DART_PUBSPEC = b"name: package\ndependencies:\n  path: ^1.8.0\n"
+MAIN_MANIFEST = b'<manifest><application><activity><intent-filter><action android:name="android.intent.action.MAIN" /></intent-filter></activity></application></manifest>'
+LIBRARY_MANIFEST = b"<manifest package=\"com.example.library\" />"
+
+
+def synthetic_repo(modules: int, seed: int = 0):
+    # monorepo with flutter apps, plain dart packages and android libraries, some nested and some under example/
+    random.seed(seed)
+    pubspecs, manifests, gradle_files = [], [], []
+    for i in range(modules):
+        group = f"packages/group{i % 50}"
+        kind = random.random()
+        module = f"{group}/module{i}" if random.random() < 0.9 else f"{group}/module{i}/example"
+        if kind < 0.3:
+            pubspecs.append(MyFile(f"{module}/pubspec.yaml", FLUTTER_PUBSPEC))
+            manifests.append(MyFile(f"{module}/android/app/src/main/AndroidManifest.xml", MAIN_MANIFEST))
+            manifests.append(MyFile(f"{module}/android/app/src/debug/AndroidManifest.xml", LIBRARY_MANIFEST))
+            gradle_files.append(MyFile(f"{module}/android/build.gradle", b"buildscript {}\n"))
+            gradle_files.append(MyFile(f"{module}/android/app/build.gradle", f'android {{ defaultConfig {{ applicationId "com.example.app{i % (modules // 2)}" }} }}\n'.encode()))
+        elif kind < 0.6:
+            pubspecs.append(MyFile(f"{module}/pubspec.yaml", DART_PUBSPEC))
+        else:
+            manifests.append(MyFile(f"{module}/src/main/AndroidManifest.xml", LIBRARY_MANIFEST))
+            gradle_files.append(MyFile(f"{module}/build.gradle", b"apply plugin: 'com.android.library'\n"))
+    return MyRepository(None, pubspecs=pubspecs, android_manifests=manifests, build_gradle_files=gradle_files)
+
+# check_flutter_repo, get_app_identifiers and filter_repo before the path index: every pubspec against every manifest and gradle file
+def baseline_check_flutter_repo(repo: MyRepository):
+    repo.apps = []
+    for pubspec in repo.pubspecs:
+        if not FLUTTER_SDK_PATTERN.search(pubspec.decoded_content.decode()):
+            continue
+        pubspec_dir = os.path.dirname(pubspec.path)
+        for android_manifest in repo.android_manifests:
+            if os.path.commonpath([pubspec_dir, android_manifest.path]) != pubspec_dir:
+                continue
+            if "android.intent.action.MAIN" not in android_manifest.decoded_content.decode():
+                continue
+            if "example/" in android_manifest.path:
+                continue
+            repo.is_flutter = True
+            repo.apps.append(MyApp(pubspec_dir, pubspec, android_manifest))
+    return repo
+
+def baseline_get_app_identifiers(repo: MyRepository):
+    for build_gradle_file in repo.build_gradle_files:
+        m = re.search(r'''applicationId\s+(?:=\s*)?["']([a-zA-Z0-9_.]+)["']''', build_gradle_file.decoded_content.decode())
+        try:
+            for app in repo.apps:
+                if os.path.commonpath([app.path, build_gradle_file.path]) == app.path:
+                    app.app_identifier = m[1]
+        except:
+            pass
+
+def baseline_filter_repo(repo: MyRepository):
+    if not repo.is_flutter:
+        return None
+    filtered_apps = []
+    for app_cand in repo.apps:
+        if "example/" in app_cand.path:
+            continue
+        if app_cand.app_identifier is None:
+            baseline_get_app_identifiers(repo)
+        if not app_cand.app_identifier:
+            continue
+        if "example" in app_cand.app_identifier:
+            continue
+        if any(app for app in filtered_apps if app.app_identifier == app_cand.app_identifier):
+            continue
+        filtered_apps.append(app_cand)
+    if len(filtered_apps) != 1:
+        return None
+    repo.apps = filtered_apps
+    return repo
+
+def run(check, filter, repo: MyRepository):
+    start = perf_counter()
+    check(repo)
+    checked = perf_counter() - start
+    apps = [(app.path, app.android_manifest.path) for app in repo.apps]
+    start = perf_counter()
+    kept = filter(repo) is not None
+    filtered = perf_counter() - start
+    return checked, filtered, apps, kept, [(app.path, app.app_identifier) for app in repo.apps]
+
+def main():
+    argparser = ArgumentParser(description="benchmark check_flutter_repo and filter_repo on synthetic monorepo trees")
+    argparser.add_argument("-m", "--modules", type=int, nargs="+", default=[500, 2000, 5000])
+    args = argparser.parse_args()
+
+    for modules in args.modules:
+        repo = synthetic_repo(modules)
+        baseline = run(baseline_check_flutter_repo, baseline_filter_repo, deepcopy(repo))
+        indexed = run(check_flutter_repo, filter_repo, deepcopy(repo))
+        assert baseline[2:] == indexed[2:], "path index changed the result"
+        print(f"{modules} modules, {len(baseline[2])} apps: check_flutter {baseline[0]:.3f}s -> {indexed[0]:.3f}s, filter {baseline[1]:.3f}s -> {indexed[1]:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import os, sys, json, sqlite3, shutil, statistics
+from os.path import realpath, dirname
+from argparse import ArgumentParser
+from subprocess import run, check_output, Popen, CalledProcessError
+from time import perf_counter
+
+# stands in for the dart executable of both Flutter SDKs: pub get, custom_lint, the lint daemon and the lint rule list,
+# with latencies and output volume from the BENCH_* environment variables
+STUB_DART = '''#!{python}
+import os, sys, json, time
+
+args = sys.argv[1:]
+rules = json.loads(os.environ["BENCH_RULES"])
+
+def sleep(name):
+    time.sleep(float(os.environ.get(name, "0")))
+
+def directory():
+    return next(arg.removeprefix("--directory=") for arg in args if arg.startswith("--directory="))
+
+# the same diagnostic at every location whichever rules are enabled, like custom_lint and the daemon report
+def diagnostics(app_path, enabled):
+    codes = [rule.lower() for rule in rules]
+    enabled = {{rule.lower() for rule in enabled or rules}}
+    files = int(os.environ["BENCH_FILES"])
+    return [{{
+        "code": codes[i % len(codes)],
+        "severity": "INFO",
+        "type": "LINT",
+        "location": {{"file": f"{{app_path}}/lib/src/file_{{i % files}}.dart", "range": {{"start": {{"offset": i * 40, "line": i + 1, "column": 3}}, "end": {{"offset": i * 40 + 12, "line": i + 1, "column": 15}}}}}},
+        "problemMessage": f"Usage of the API found by {{codes[i % len(codes)]}}",
+    }} for i in range(int(os.environ["BENCH_FINDINGS"])) if codes[i % len(codes)] in enabled]
+
+if args[:1] == ["pub"]:
+    sleep("BENCH_PUB_LATENCY")
+    os.makedirs(f"{{directory()}}/.dart_tool", exist_ok=True)
+    with open(f"{{directory()}}/pubspec.lock", "w") as f:
+        f.write("packages: {{}}\\n")
+    with open(f"{{directory()}}/.dart_tool/package_config.json", "w") as f:
+        json.dump({{"configVersion": 2, "packages": []}}, f)
+elif args[:2] == ["run", "thesis_lints"]:
+    print(json.dumps(rules))
+elif args[:2] == ["run", "custom_lint"] and "--help" in args:
+    print("Building package executable...")
+    print("Usage: custom_lint [options]")
+elif args[:2] == ["run", "custom_lint"]:
+    sleep("BENCH_LINT_STARTUP")
+    sleep("BENCH_LINT_LATENCY")
+    print("Building package executable...")
+    json.dump({{"version": 1, "diagnostics": diagnostics(directory(), None)}}, sys.stdout)
+    # like custom_lint, which exits with 1 when it reports warnings
+    sys.exit(1)
+elif args[:2] == ["run", "thesis_lints:lint_daemon"]:
+    sleep("BENCH_LINT_STARTUP")
+    # `dart run` prints build progress to stdout before the executable starts, for the daemon as well
+    print("Building package executable...", flush=True)
+    print(json.dumps({{"ready": True}}), flush=True)
+    for line in sys.stdin:
+        request = json.loads(line)
+        sleep("BENCH_LINT_LATENCY")
+        print(json.dumps({{"version": 1, "diagnostics": diagnostics(request["directory"], request["rules"])}}), flush=True)
+else:
+    sys.exit(f"stub dart: unsupported command {{args}}")
+'''
+
+MODES = {
+    "sequential": [],
+    "parallel": ["-j", "{jobs}"],
+    "daemon": ["-j", "{jobs}", "--daemon"],
+    # {jobs} worker processes claiming apps from the main database and writing to their own, merged afterwards
+    "queue": ["--queue", "{database}", "--output", "{output}"],
+}
+
+
+def git(git_dir: str, work_tree: str, *args: str):
+    check_output(["git", f"--git-dir={git_dir}", f"--work-tree={work_tree}", "-c", "user.name=bench", "-c", "user.email=bench@localhost", *args])
+
+def create_corpus(corpus_dir: str, apps: int, files: int, file_size: int):
+    # bare repos of Flutter-shaped apps in <corpus_dir>/bench/app<i>.git, fetched instead of https://github.com/bench/app<i>
+    for i in range(apps):
+        git_dir = f"{corpus_dir}/bench/app{i}.git"
+        if os.path.isdir(git_dir):
+            continue
+        work_tree = f"{corpus_dir}/work"
+        shutil.rmtree(work_tree, ignore_errors=True)
+        os.makedirs(f"{work_tree}/lib/src")
+        os.makedirs(f"{work_tree}/android/app/src/main")
+        with open(f"{work_tree}/pubspec.yaml", "w") as f:
+            # unique names, so that every app gets its own pub resolution
+            f.write(f"name: app{i}\nenvironment:\n  sdk: '>=3.0.0 <4.0.0'\ndependencies:\n  flutter:\n    sdk: flutter\n")
+        with open(f"{work_tree}/android/app/src/main/AndroidManifest.xml", "w") as f:
+            f.write('<manifest><application><activity><intent-filter><action android:name="android.intent.action.MAIN" /></intent-filter></activity></application></manifest>\n')
+        with open(f"{work_tree}/android/app/build.gradle", "w") as f:
+            f.write(f'android {{ defaultConfig {{ applicationId "com.example.app{i}" }} }}\n')
+        with open(f"{work_tree}/lib/main.dart", "w") as f:
+            f.write("void main() {}\n")
+        line = "  final value = File('/data/user/0/app/files/cache.txt').readAsStringSync();\n"
+        for j in range(files):
+            with open(f"{work_tree}/lib/src/file_{j}.dart", "w") as f:
+                f.write(f"import 'dart:io';\n\nvoid function{j}() {{\n" + line * max(1, file_size // len(line)) + "}\n")
+        check_output(["git", "init", "--quiet", "--bare", git_dir])
+        git(git_dir, work_tree, "add", "--all")
+        git(git_dir, work_tree, "commit", "--quiet", "-m", "app")
+        shutil.rmtree(work_tree)
+
+def create_database(path: str, apps: int, rules: list[str]):
+    connection = sqlite3.connect(path)
+    with open(f"{dirname(realpath(__file__))}/create_db.sql") as f:
+        connection.executescript(f.read())
+    connection.executemany("INSERT INTO lint_rule (name) VALUES (?)", [(rule,) for rule in rules])
+    connection.executemany(
+        "INSERT INTO app (package_id, github_name, github_repo, github_stars, path, pubspec_path) VALUES (?, ?, ?, ?, '', 'pubspec.yaml')",
+        [(f"com.example.app{i}", f"bench/app{i}", f"https://github.com/bench/app{i}", apps - i) for i in range(apps)]
+    )
+    connection.commit()
+    connection.close()
+
+def percentile(values: list[float], p: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def report(name: str, database: str, wall: float):
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    # every mode starts with a fresh database, the queue mode merges one run per worker
+    stages = connection.execute("SELECT * FROM scan_stage").fetchall()
+    analyzed = connection.execute("SELECT count(*) FROM app WHERE analyzed").fetchone()[0]
+    findings = connection.execute("SELECT count(*) FROM finding").fetchone()[0]
+    connection.close()
+    writes = [stage for stage in stages if stage["stage"] == "write"]
+    write_time = sum(stage["duration"] for stage in writes)
+    print(f"\n{name}: {analyzed} apps analyzed in {wall:.1f}s, {analyzed / wall * 3600:,.0f} apps/hour, {findings:,} findings, "
+          f"DB writes {findings / write_time if write_time else 0:,.0f} findings/s ({write_time:.2f}s in the writer)")
+    print(f"  {'stage':<10}{'count':>7}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'max s':>9}{'mean s':>9}")
+    for stage_name in ("clone", "clean", "workspace", "pub_get", "analyze", "write"):
+        durations = [stage["duration"] for stage in stages if stage["stage"] == stage_name]
+        if durations:
+            print(f"  {stage_name:<10}{len(durations):>7}{percentile(durations, 0.5):>9.3f}{percentile(durations, 0.95):>9.3f}{percentile(durations, 0.99):>9.3f}{max(durations):>9.3f}{statistics.mean(durations):>9.3f}")
+    errors = [stage["error"] for stage in stages if stage["error"]]
+    if errors:
+        print(f"  {len(errors)} failed stages, first: {errors[0][:200]}")
+
+def run_workers(commands: list[list[str]], env: dict):
+    # reposcanner.py reads create_db.sql from its working directory
+    processes = [Popen(command, env=env, cwd=dirname(realpath(__file__))) for command in commands]
+    for process in processes:
+        if process.wait():
+            raise CalledProcessError(process.returncode, process.args)
+
+def check_sequential_merge(python: str, mode_dir: str, commands: list[list[str]], env: dict, expected: int):
+    # the lint rules changed since the first round: every worker starts from a copy of the main database with the old results,
+    # merging the workers one after another must keep what each of them analyzed instead of restoring the copies
+    connection = sqlite3.connect(f"{mode_dir}/findings.db")
+    with connection:
+        connection.execute("DELETE FROM work_lease")
+        connection.execute("UPDATE analysis_fingerprint SET fingerprint = 'old rules'")
+        connection.execute("DELETE FROM finding")
+    connection.close()
+    for i in range(len(commands)):
+        os.remove(f"{mode_dir}/worker{i}.db")
+    run_workers(commands, env)
+    for i in range(len(commands)):
+        run([python, "reposcanner.py", f"{mode_dir}/reposcanner.json", "--merge", f"{mode_dir}/worker{i}.db"], cwd=dirname(realpath(__file__)), check=True)
+    connection = sqlite3.connect(f"{mode_dir}/findings.db")
+    findings = connection.execute("SELECT count(*) FROM finding").fetchone()[0]
+    old = connection.execute("SELECT count(*) FROM analysis_fingerprint WHERE fingerprint = 'old rules'").fetchone()[0]
+    connection.close()
+    assert findings == expected and not old, f"sequential merge lost results: {findings} of {expected} findings, {old} old fingerprints"
+    print(f"  sequential merge after a rule change: {findings:,} findings, no old fingerprints")
+
+def main():
+    argparser = ArgumentParser(description="offline end-to-end benchmark of reposcanner.py on local bare repos with a stub dart executable")
+    argparser.add_argument("-n", "--apps", type=int, default=50)
+    argparser.add_argument("--files", type=int, default=20, help="dart files per app")
+    argparser.add_argument("--file-size", type=int, default=4096, help="bytes per dart file")
+    argparser.add_argument("--findings", type=int, default=200, help="diagnostics reported per app")
+    argparser.add_argument("--rules", type=int, default=20)
+    argparser.add_argument("--pub-latency", type=float, default=0.5, help="seconds per dart pub get")
+    argparser.add_argument("--lint-startup", type=float, default=2.0, help="seconds until custom_lint or the lint daemon is ready")
+    argparser.add_argument("--lint-latency", type=float, default=0.5, help="seconds custom_lint analyzes one app")
+    argparser.add_argument("-j", "--jobs", type=int, default=4, help="jobs of the parallel and daemon modes, worker processes of the queue mode")
+    argparser.add_argument("-m", "--modes", nargs="+", choices=MODES.keys(), default=list(MODES.keys()))
+    argparser.add_argument("-d", "--dir", default="bench_reposcanner", help="work directory, the corpus is kept between runs")
+    argparser.add_argument("--python", default=sys.executable, help="interpreter for reposcanner.py (3.12+)")
+    args = argparser.parse_args()
+
+    work_dir = realpath(args.dir)
+    corpus_dir = f"{work_dir}/corpus"
+    start = perf_counter()
+    create_corpus(corpus_dir, args.apps, args.files, args.file_size)
+    print(f"corpus of {args.apps} apps ready in {perf_counter() - start:.1f}s")
+
+    sdk_dir = f"{work_dir}/sdk"
+    os.makedirs(sdk_dir, exist_ok=True)
+    with open(f"{sdk_dir}/dart", "w") as f:
+        f.write(STUB_DART.format(python=args.python))
+    os.chmod(f"{sdk_dir}/dart", 0o755)
+    rules = [f"BenchRule{i}" for i in range(args.rules)]
+    env = os.environ | {
+        "BENCH_RULES": json.dumps(rules),
+        "BENCH_FILES": str(args.files),
+        "BENCH_FINDINGS": str(args.findings),
+        "BENCH_PUB_LATENCY": str(args.pub_latency),
+        "BENCH_LINT_STARTUP": str(args.lint_startup),
+        "BENCH_LINT_LATENCY": str(args.lint_latency),
+        # clones of https://github.com/bench/* come from the corpus
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": f"url.{corpus_dir}/.insteadOf",
+        "GIT_CONFIG_VALUE_0": "https://github.com/",
+    }
+
+    for mode in args.modes:
+        mode_dir = f"{work_dir}/{mode}"
+        shutil.rmtree(mode_dir, ignore_errors=True)
+        os.makedirs(f"{mode_dir}/repos")
+        create_database(f"{mode_dir}/findings.db", args.apps, rules)
+        with open(f"{mode_dir}/reposcanner.json", "w") as f:
+            json.dump({"database": f"{mode_dir}/findings.db", "repos_dir": f"{mode_dir}/repos", "flutter_3_7_12": sdk_dir, "flutter_3_27_0": sdk_dir}, f)
+        workers = args.jobs if mode == "queue" else 1
+        commands = [
+            [args.python, "reposcanner.py", f"{mode_dir}/reposcanner.json"] + [arg.format(jobs=args.jobs, database=f"{mode_dir}/findings.db", output=f"{mode_dir}/worker{i}.db") for arg in MODES[mode]]
+            for i in range(workers)
+        ]
+        start = perf_counter()
+        run_workers(commands, env)
+        if mode == "queue":
+            run([args.python, "reposcanner.py", f"{mode_dir}/reposcanner.json", "--merge", *(f"{mode_dir}/worker{i}.db" for i in range(workers))], cwd=dirname(realpath(__file__)), check=True)
+        report(mode, f"{mode_dir}/findings.db", perf_counter() - start)
+        if mode == "queue":
+            check_sequential_merge(args.python, mode_dir, commands, env, args.apps * args.findings)
+
+if __name__ == "__main__":
+    main()
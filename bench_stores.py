@@ -0,0 +1,75 @@
+import threading, zlib
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from time import sleep, monotonic, perf_counter
+
+from fetch_repo import MyRepository, MyApp, check_stores
+
+
+class StubStoreHandler(BaseHTTPRequestHandler):
+    # stands in for the Play Store and F-Droid: fixed latency, 429 when a host exceeds its rate limit
+    latency = 0.05
+    server_rate = 50
+    allowance = {}
+    updated = {}
+    stats = {"requests": 0, "rate_limited": 0}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        host = url.path.split("/")[1]
+        with self.lock:
+            self.stats["requests"] += 1
+            now = monotonic()
+            allowance = min(self.server_rate, self.allowance.get(host, self.server_rate) + (now - self.updated.get(host, now)) * self.server_rate)
+            self.updated[host] = now
+            limited = allowance < 1
+            self.allowance[host] = allowance if limited else allowance - 1
+            if limited:
+                self.stats["rate_limited"] += 1
+        sleep(self.latency)
+        if limited:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        app_identifier = parse_qs(url.query).get("id", [url.path.rstrip("/").split("/")[-1]])[0]
+        self.send_response(200 if zlib.crc32(app_identifier.encode()) % 3 == 0 else 404)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    argparser = ArgumentParser(description="benchmark check_stores against a local stub store server")
+    argparser.add_argument("-n", "--apps", type=int, default=500)
+    argparser.add_argument("-w", "--workers", type=int, default=16)
+    argparser.add_argument("--rate", type=float, default=40, help="client requests per second per store")
+    argparser.add_argument("--server-rate", type=float, default=50, help="requests per second per store before the stub answers 429")
+    argparser.add_argument("--latency", type=float, default=0.05)
+    args = argparser.parse_args()
+
+    StubStoreHandler.latency = args.latency
+    StubStoreHandler.server_rate = args.server_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubStoreHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    repos = [
+        MyRepository(None, is_flutter=True, build_gradle_files=[], apps=[MyApp(".", None, None, app_identifier=f"com.example.app{i}")])
+        for i in range(args.apps)
+    ]
+    start = perf_counter()
+    check_stores(repos, workers=args.workers, rate=args.rate, playstore_url=f"{base_url}/playstore", fdroid_url=f"{base_url}/fdroid/")
+    duration = perf_counter() - start
+    server.shutdown()
+
+    found = sum(1 for repo in repos for app in repo.apps if app.playstore_url)
+    print(f"apps: {args.apps} duration: {duration:.2f}s throughput: {args.apps / duration:.1f} apps/s")
+    print(f"requests: {StubStoreHandler.stats['requests']} rate limited (429): {StubStoreHandler.stats['rate_limited']} playstore hits: {found}")
+
+if __name__ == "__main__":
+    main()
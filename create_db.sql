@@ -47,14 +47,124 @@ CREATE TABLE IF NOT EXISTS "lint_rule" (
 	"finds_dangerous_pattern"	BOOLEAN NOT NULL DEFAULT 0,
 	PRIMARY KEY("id" AUTOINCREMENT)
 );
+CREATE TABLE IF NOT EXISTS "finding_file" (
+	"id"	INTEGER,
+	"app"	INTEGER NOT NULL,
+	"path"	TEXT NOT NULL,
+	PRIMARY KEY("id" AUTOINCREMENT),
+	UNIQUE("app", "path"),
+	FOREIGN KEY("app") REFERENCES "app"("id")
+);
 CREATE TABLE IF NOT EXISTS "finding" (
 	"id"	INTEGER,
 	"vulnerable"	BOOLEAN,
 	"description"	TEXT,
-	"location"	TEXT,
+	"file"	INTEGER,
+	"offset"	INTEGER,
+	"length"	INTEGER,
+	"line"	INTEGER,
+	"column"	INTEGER,
+	"end_line"	INTEGER,
+	"end_column"	INTEGER,
 	"app"	INTEGER NOT NULL,
 	"lint_rule"	INTEGER,
 	PRIMARY KEY("id" AUTOINCREMENT),
+	FOREIGN KEY("file") REFERENCES "finding_file"("id"),
+	FOREIGN KEY("app") REFERENCES "app"("id"),
+	FOREIGN KEY("lint_rule") REFERENCES "lint_rule"("id")
+);
+-- finding with the location as JSON like it was stored before
+CREATE VIEW IF NOT EXISTS "finding_json" AS
+	SELECT "finding"."id", "vulnerable", "description",
+		CASE WHEN "file" IS NULL THEN NULL WHEN "offset" IS NULL THEN "finding_file"."path" ELSE json_object(
+			'file', "finding_file"."path",
+			'range', json_object(
+				'start', json_object('offset', "offset", 'line', "line", 'column', "column"),
+				'end', json_object('offset', "offset" + "length", 'line', "end_line", 'column', "end_column")
+			)
+		) END AS "location",
+		"finding"."app", "lint_rule"
+	FROM "finding" LEFT JOIN "finding_file" ON "finding"."file" = "finding_file"."id";
+CREATE TABLE IF NOT EXISTS "analysis_fingerprint" (
+	"app"	INTEGER NOT NULL,
+	"lint_rule"	TEXT NOT NULL,
+	"fingerprint"	TEXT NOT NULL,
+	PRIMARY KEY("app", "lint_rule"),
+	FOREIGN KEY("app") REFERENCES "app"("id")
+);
+CREATE INDEX IF NOT EXISTS "finding_app_lint_rule" ON "finding" ("app", "lint_rule");
+CREATE INDEX IF NOT EXISTS "finding_lint_rule" ON "finding" ("lint_rule");
+CREATE INDEX IF NOT EXISTS "finding_file_line" ON "finding" ("file", "line");
+CREATE INDEX IF NOT EXISTS "lint_rule_name_nocase" ON "lint_rule" ("name" COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS "api_lint_rule" ON "api" ("lint_rule");
+CREATE TABLE IF NOT EXISTS "scan_run" (
+	"id"	INTEGER,
+	"started_at"	REAL NOT NULL,
+	"finished_at"	REAL,
+	"jobs"	INTEGER NOT NULL,
+	"args"	TEXT,
+	PRIMARY KEY("id" AUTOINCREMENT)
+);
+-- durations and CPU times in seconds, max_rss in KiB, bytes fetched by clone
+CREATE TABLE IF NOT EXISTS "scan_stage" (
+	"id"	INTEGER,
+	"run"	INTEGER NOT NULL,
+	"app"	INTEGER NOT NULL,
+	"stage"	TEXT NOT NULL,
+	"started_at"	REAL NOT NULL,
+	"duration"	REAL NOT NULL,
+	"cpu_user"	REAL,
+	"cpu_system"	REAL,
+	"max_rss"	INTEGER,
+	"bytes"	INTEGER,
+	"detail"	TEXT,
+	"findings"	INTEGER,
+	"error"	TEXT,
+	PRIMARY KEY("id" AUTOINCREMENT),
+	FOREIGN KEY("run") REFERENCES "scan_run"("id"),
+	FOREIGN KEY("app") REFERENCES "app"("id")
+);
+CREATE INDEX IF NOT EXISTS "scan_stage_run_stage" ON "scan_stage" ("run", "stage");
+-- materialized finding counts per app, refreshed by reposcanner.py for every app whose findings it rewrites.
+-- vulnerable counts the findings confirmed as vulnerable, edits of finding need `reposcanner.py --refresh-summary`
+CREATE TABLE IF NOT EXISTS "app_rule_summary" (
+	"app"	INTEGER NOT NULL,
+	"lint_rule"	INTEGER NOT NULL,
+	"findings"	INTEGER NOT NULL,
+	"vulnerable"	INTEGER NOT NULL,
+	PRIMARY KEY("app", "lint_rule"),
 	FOREIGN KEY("app") REFERENCES "app"("id"),
 	FOREIGN KEY("lint_rule") REFERENCES "lint_rule"("id")
 );
+CREATE TABLE IF NOT EXISTS "app_risk_summary" (
+	"app"	INTEGER NOT NULL,
+	"risk"	INTEGER NOT NULL,
+	"findings"	INTEGER NOT NULL,
+	"vulnerable"	INTEGER NOT NULL,
+	PRIMARY KEY("app", "risk"),
+	FOREIGN KEY("app") REFERENCES "app"("id"),
+	FOREIGN KEY("risk") REFERENCES "common_risk"("id")
+);
+CREATE TABLE IF NOT EXISTS "app_category_summary" (
+	"app"	INTEGER NOT NULL,
+	"masvs_category"	INTEGER NOT NULL,
+	"findings"	INTEGER NOT NULL,
+	"vulnerable"	INTEGER NOT NULL,
+	PRIMARY KEY("app", "masvs_category"),
+	FOREIGN KEY("app") REFERENCES "app"("id"),
+	FOREIGN KEY("masvs_category") REFERENCES "masvs_category"("id")
+);
+
+-- apps of a scan spread over several workers (`reposcanner.py --queue`). a worker owns an app until expires_at and renews
+-- the lease while analyzing it, apps of crashed workers are claimed again after expiry
+CREATE TABLE IF NOT EXISTS "work_lease" (
+	"app"	INTEGER NOT NULL,
+	"priority"	INTEGER NOT NULL,
+	"owner"	TEXT,
+	"expires_at"	REAL,
+	"attempts"	INTEGER NOT NULL DEFAULT 0,
+	"finished_at"	REAL,
+	"error"	TEXT,
+	PRIMARY KEY("app")
+);
+CREATE INDEX IF NOT EXISTS "work_lease_pending" ON "work_lease" ("finished_at", "priority");
@@ -4,26 +4,84 @@ from typing import Optional
 from tqdm import tqdm
 from github import Github, Auth
 from github.Repository import Repository
-from github.GitTree import GitTree
-from github.ContentFile import ContentFile
-from subprocess import check_output
-from datetime import datetime
-import pickle, os, re, csv
-from argparse import ArgumentParser
-from dataclasses import dataclass
-from requests import session
+from subprocess import check_output, run, PIPE
+from datetime import datetime, date, timedelta
+import pickle, os, re, csv, json, html
+from base64 import b64decode
+from argparse import ArgumentParser, BooleanOptionalAction
+from dataclasses import dataclass, asdict
+from functools import cached_property, partial
+from typing import Iterable, Iterator
+from requests import session, Session
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
-from time import sleep
+from time import sleep, monotonic
+from threading import Lock, Semaphore, Thread
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
 import sqlite3
+from http_cache import ResponseCache, CachingAdapter, install_github_cache
 
 PLAYSTORE_URL = "https://play.google.com/store/apps/details"
 FDROID_URL = "https://f-droid.org/en/packages/"
+HTTP_CACHE: Optional[ResponseCache] = None
+G: Optional[Github] = None
+G_LOCK = Lock()
+
+def github() -> Github:
+    # created on first use, so that `check --local` works offline without GITHUB_TOKEN
+    global G
+    with G_LOCK:
+        if G is None:
+            token = os.getenv("GITHUB_TOKEN")
+            if not token:
+                raise Exception("GITHUB_TOKEN is not set, it is required for GitHub API calls")
+            G = Github(auth=Auth.Token(token), per_page=100)
+        return G
+
+def new_session(pool_maxsize: int = 10) -> Session:
+    s = session()
+    for prefix in ("https://", "http://"):
+        if HTTP_CACHE:
+            s.mount(prefix, CachingAdapter(HTTP_CACHE, pool_connections=2, pool_maxsize=pool_maxsize))
+        else:
+            s.mount(prefix, HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize))
+    return s
+
+@dataclass
+class RepoInfo:
+    full_name: str
+    html_url: str
+    stargazers_count: int
+    description: Optional[str]
+    default_branch: str
+
+    @staticmethod
+    def from_repository(repository: Repository):
+        return RepoInfo(repository.full_name, repository.html_url, repository.stargazers_count, repository.description, repository.default_branch)
+
+@dataclass
+class TreeEntry:
+    path: str
+    type: str
+    sha: str
+
+@dataclass
+class MyFile:
+    path: str
+    decoded_content: bytes
+
+    # decoded once, check_flutter and get_app_identifiers read the same files many times
+    @cached_property
+    def text(self) -> str:
+        return self.decoded_content.decode()
 
 @dataclass
 class MyApp:
     path: str
-    pubspec: ContentFile
-    android_manifest: ContentFile
+    pubspec: MyFile
+    android_manifest: MyFile
     app_identifier: Optional[str] = None
     playstore_url: Optional[str] = None
     fdroid_url: Optional[str] = None
@@ -33,172 +91,397 @@ class MyApp:
 
 @dataclass
 class MyRepository:
-    repository: Repository
-    git_tree: GitTree = None
+    repository: RepoInfo
+    git_tree: Optional[list[TreeEntry]] = None
     is_flutter: bool = False
-    pubspecs: Optional[list[ContentFile]] = None
-    android_manifests: Optional[list[ContentFile]] = None
-    build_gradle_files: Optional[list[ContentFile]] = None
+    pubspecs: Optional[list[MyFile]] = None
+    android_manifests: Optional[list[MyFile]] = None
+    build_gradle_files: Optional[list[MyFile]] = None
     apps: Optional[list[MyApp]] = None
 
 
-def get_pubspecs_manifests(repo: MyRepository):
-    repo.pubspecs = []
-    repo.android_manifests = []
-    for file in repo.git_tree.tree:
-        filename = os.path.basename(file.path)
-        if filename == "pubspec.yaml":
-            repo.pubspecs.append(repo.repository.get_contents(file.path))
-        elif filename == "AndroidManifest.xml":
-            repo.android_manifests.append(repo.repository.get_contents(file.path))
-
-def get_build_gradle_files(repo: MyRepository):
-    repo.build_gradle_files = []
-    for file in repo.git_tree.tree:
+BLOB_BATCH_SIZE = 100
+PROBE_BATCH_SIZE = 25
+# directory levels the pre-filter looks for a pubspec.yaml in, e.g. packages/apps/<app>/pubspec.yaml. deeper apps are only found with --no-prefilter
+PROBE_DEPTH = 3
+REPO_FILE_NAMES = ("pubspec.yaml", "AndroidManifest.xml", "build.gradle", "build.gradle.kts")
+FLUTTER_SDK_PATTERN = re.compile(r"flutter:\n\s+sdk:\s*flutter")
+APPLICATION_ID_PATTERN = re.compile(r'''applicationId\s+(?:=\s*)?["']([a-zA-Z0-9_.]+)["']''')
+
+def fetch_blobs(full_name: str, shas: list[str]) -> dict[str, bytes]:
+    # one GraphQL query per batch of blobs instead of one REST get_contents call per file
+    contents = {}
+    owner, name = full_name.split("/", 1)
+    for i in range(0, len(shas), BLOB_BATCH_SIZE):
+        batch = shas[i:i + BLOB_BATCH_SIZE]
+        params = "".join(f", $oid{j}: GitObjectID!" for j in range(len(batch)))
+        fields = "".join(f" b{j}: object(oid: $oid{j}) {{ ... on Blob {{ text isBinary isTruncated }} }}" for j in range(len(batch)))
+        query = f"query($owner: String!, $name: String!{params}) {{ repository(owner: $owner, name: $name) {{{fields} }} }}"
+        variables = {"owner": owner, "name": name} | {f"oid{j}": sha for j, sha in enumerate(batch)}
+        _, data = github().requester.graphql_query(query, variables)
+        for j, sha in enumerate(batch):
+            blob = data["data"]["repository"][f"b{j}"]
+            if blob is None or blob["isBinary"]:
+                continue
+            if blob["isTruncated"]:
+                contents[sha] = b64decode(github().get_repo(full_name, lazy=True).get_git_blob(sha).content)
+            else:
+                contents[sha] = blob["text"].encode()
+    return contents
+
+def fetch_git_tree(repo: MyRepository):
+    # only fetched for repos that passed the pre-filter, and only the paths of files the pipeline reads are kept
+    git_tree = github().get_repo(repo.repository.full_name, lazy=True).get_git_tree(repo.repository.default_branch, recursive=True)
+    repo.git_tree = [
+        TreeEntry(entry.path, entry.type, entry.sha) for entry in git_tree.tree
+        if entry.type == "blob" and os.path.basename(entry.path) in REPO_FILE_NAMES
+    ]
+    return repo
+
+def local_git_dir(local_dir: str, repo: MyRepository):
+    # same layout as the mirrors of reposcanner.py: <local_dir>/<owner>/<name>.git
+    return f"{local_dir}/{repo.repository.full_name}.git"
+
+def local_git_tree(git_dir: str, repo: MyRepository) -> list[TreeEntry]:
+    if not os.path.isdir(git_dir):
+        raise Exception(f"{git_dir}: no local clone")
+    # default branch of a bare clone, HEAD of a mirror or the commit last fetched by reposcanner.py
+    for rev in (f"refs/heads/{repo.repository.default_branch}", "HEAD", "FETCH_HEAD"):
+        if run(["git", "--git-dir", git_dir, "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"], stdout=PIPE, stderr=PIPE).returncode == 0:
+            break
+    else:
+        raise Exception(f"{git_dir}: no commit to check")
+    output = check_output(["git", "--git-dir", git_dir, "ls-tree", "-r", "-z", rev])
+    git_tree = []
+    for line in output.split(b"\0"):
+        if not line:
+            continue
+        info, path = line.split(b"\t", 1)
+        _, type, sha = info.decode().split()
+        path = path.decode("utf-8", "replace")
+        if type == "blob" and os.path.basename(path) in REPO_FILE_NAMES:
+            git_tree.append(TreeEntry(path, type, sha))
+    return git_tree
+
+def read_local_blobs(git_dir: str, shas: list[str]) -> dict[str, bytes]:
+    # all blobs through one `git cat-file --batch`: "<sha> blob <size>\n<content>\n" per requested object
+    output = run(["git", "--git-dir", git_dir, "cat-file", "--batch"], input="".join(f"{sha}\n" for sha in shas).encode(), stdout=PIPE, check=True).stdout
+    contents = {}
+    position = 0
+    while position < len(output):
+        end = output.index(b"\n", position)
+        header = output[position:end].split()
+        position = end + 1
+        if header[1] == b"missing":
+            continue
+        size = int(header[2])
+        content = output[position:position + size]
+        position += size + 1
+        # binary blobs are skipped like in fetch_blobs, git treats content with a NUL byte as binary
+        if b"\0" not in content[:8000]:
+            contents[header[0].decode()] = content
+    return contents
+
+def get_repo_files(repo: MyRepository, git_dir: str = None):
+    # single pass over the tree that collects pubspecs, manifests and gradle files for check_flutter and get_app_identifiers.
+    # with git_dir the tree and files are read from a local bare clone instead of the API
+    if git_dir:
+        repo.git_tree = local_git_tree(git_dir, repo)
+    elif repo.git_tree is None:
+        fetch_git_tree(repo)
+    files = {name: [] for name in REPO_FILE_NAMES}
+    for file in repo.git_tree:
         filename = os.path.basename(file.path)
-        if filename == "build.gradle" or filename == "build.gradle.kts":
-            repo.build_gradle_files.append(repo.repository.get_contents(file.path))
+        if file.type == "blob" and filename in files:
+            files[filename].append(file)
+    shas = list({file.sha for file_list in files.values() for file in file_list})
+    contents = read_local_blobs(git_dir, shas) if git_dir else fetch_blobs(repo.repository.full_name, shas)
+    def to_my_files(file_list):
+        return [MyFile(file.path, contents[file.sha]) for file in file_list if file.sha in contents]
+    repo.pubspecs = to_my_files(files["pubspec.yaml"])
+    repo.android_manifests = to_my_files(files["AndroidManifest.xml"])
+    repo.build_gradle_files = to_my_files(files["build.gradle"] + files["build.gradle.kts"])
+
+def path_prefixes(path: str):
+    # "", "a", "a/b", "a/b/c" for "a/b/c": every directory d with os.path.commonpath([d, path]) == d.
+    # looking these up in a dict of directories walks the path like a prefix trie, instead of comparing every pair of paths
+    yield ""
+    end = path.find("/")
+    while end != -1:
+        yield path[:end]
+        end = path.find("/", end + 1)
+    yield path
 
 def get_app_identifiers(repo: MyRepository):
     repo.app_identifiers = []
+    apps_by_path = {}
+    for app in repo.apps:
+        apps_by_path.setdefault(app.path, []).append(app)
+    # later gradle files overwrite the identifier of an app, like the pairwise comparison did
     for build_gradle_file in repo.build_gradle_files:
-        m = re.search(r'''applicationId\s+(?:=\s*)?["']([a-zA-Z0-9_.]+)["']''', build_gradle_file.decoded_content.decode())
         try:
-            for app in repo.apps:
-                if os.path.commonpath([app.path, build_gradle_file.path]) == app.path:
-                    app.app_identifier = m[1]
-        except:
-            pass
+            m = APPLICATION_ID_PATTERN.search(build_gradle_file.text)
+        except UnicodeDecodeError:
+            continue
+        if not m:
+            continue
+        for directory in path_prefixes(build_gradle_file.path):
+            for app in apps_by_path.get(directory, ()):
+                app.app_identifier = m[1]
+
+
+def check_flutter_repo(repo: MyRepository, local_dir: str = None):
+    if local_dir:
+        get_repo_files(repo, local_git_dir(local_dir, repo))
+    elif repo.pubspecs is None or repo.android_manifests is None or repo.build_gradle_files is None:
+        get_repo_files(repo)
+
+    repo.apps = []
+    flutter_pubspecs = [pubspec for pubspec in repo.pubspecs if FLUTTER_SDK_PATTERN.search(pubspec.text)]
+    # manifests below every flutter pubspec dir, in tree order
+    manifests = {os.path.dirname(pubspec.path): [] for pubspec in flutter_pubspecs}
+    for android_manifest in repo.android_manifests:
+        if "example/" in android_manifest.path:
+            continue
+        pubspec_dirs = [directory for directory in path_prefixes(android_manifest.path) if directory in manifests]
+        if not pubspec_dirs or "android.intent.action.MAIN" not in android_manifest.text:
+            continue
+        for pubspec_dir in pubspec_dirs:
+            manifests[pubspec_dir].append(android_manifest)
 
+    for pubspec in flutter_pubspecs:
+        pubspec_dir = os.path.dirname(pubspec.path)
+        for android_manifest in manifests[pubspec_dir]:
+            repo.is_flutter = True
+            repo.apps.append(MyApp(pubspec_dir, pubspec, android_manifest))
+    return repo
 
-def check_flutter(repos: list[MyRepository]):
+def check_flutter(repos: list[MyRepository], local_dir: str = None):
     print(f"checking {len(repos)} repos")
+    failed = []
     for repo in tqdm(repos):
         try:
-            if repo.pubspecs is None or repo.android_manifests is None:
-                get_pubspecs_manifests(repo)
-    
-            repo.apps = []
-            for pubspec in repo.pubspecs:
-                if not re.search(r"flutter:\n\s+sdk:\s*flutter", pubspec.decoded_content.decode()):
-                    continue
-
-                pubspec_dir = os.path.dirname(pubspec.path)
-
-                for android_manifest in repo.android_manifests:
-                    if os.path.commonpath([pubspec_dir, android_manifest.path]) != pubspec_dir:
-                        continue
-                    if "android.intent.action.MAIN" not in android_manifest.decoded_content.decode():
-                        continue
-                    if "example/" in android_manifest.path: 
-                        continue
-                    repo.is_flutter = True
-                    repo.apps.append(MyApp(pubspec_dir, pubspec, android_manifest))
-
+            check_flutter_repo(repo, local_dir)
         except Exception as e:
             print(e)
+            failed.append(repo)
     print(f"flutter repos: {len([repo for repo in repos if repo.is_flutter])}")
-    return repos
+    return repos, failed
 
 
-def filter(repos: list[MyRepository]):
-    print(f"checking {len(repos)} repos")
-    filtered_repos = []
-    for repo in tqdm(repos):
-        if not repo.is_flutter:
-            continue
+# returns the repo with only its single app left, None if it has to be filtered out
+def filter_repo(repo: MyRepository):
+    if not repo.is_flutter:
+        return None
 
-        filtered_apps: list[MyApp] = []
-        for app_cand in repo.apps:
-            if "example/" in app_cand.path:
-                continue
-            if app_cand.app_identifier is None:
-                get_app_identifiers(repo)
-            if not app_cand.app_identifier:
-                continue
-            if "example" in app_cand.app_identifier:
-                continue
-            if any(app for app in filtered_apps if app.app_identifier == app_cand.app_identifier):
-                continue
-            filtered_apps.append(app_cand)
-        
-        if len(filtered_apps) != 1:
+    # get_app_identifiers sets the identifiers of all apps at once, it only has to run once per repo
+    if any(app.app_identifier is None for app in repo.apps if "example/" not in app.path):
+        get_app_identifiers(repo)
+    filtered_apps: list[MyApp] = []
+    app_identifiers = set()
+    for app_cand in repo.apps:
+        if "example/" in app_cand.path:
+            continue
+        if not app_cand.app_identifier:
+            continue
+        if "example" in app_cand.app_identifier:
             continue
-        repo.apps = filtered_apps
-        filtered_repos.append(repo)
-    return filtered_repos
+        if app_cand.app_identifier in app_identifiers:
+            continue
+        app_identifiers.add(app_cand.app_identifier)
+        filtered_apps.append(app_cand)
+    
+    if len(filtered_apps) != 1:
+        return None
+    repo.apps = filtered_apps
+    return repo
+
+def filter(repos: list[MyRepository]):
+    print(f"checking {len(repos)} repos")
+    return [repo for repo in tqdm(repos) if filter_repo(repo)], []
 
             
 
-def check_stores(repos: list[MyRepository]):
+class TokenBucket:
+    # per-host rate limit, halves the rate on 429/500 and slowly recovers on success
+    def __init__(self, rate: float, capacity: float = 1):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.paused_until = 0
+        self.lock = Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            sleep(wait)
+
+    def backoff(self, delay: float):
+        with self.lock:
+            self.rate = max(self.max_rate / 64, self.rate / 2)
+            self.paused_until = max(self.paused_until, monotonic() + delay)
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def probe_store(store_session: Session, bucket: TokenBucket, url: str, params: dict = None, max_retries: int = 6):
+    for attempt in range(max_retries):
+        bucket.acquire()
+        res = store_session.get(url, params=params)
+        if res.status_code not in (429, 500, 503):
+            bucket.recover()
+            return res
+        retry_after = res.headers.get("Retry-After", "")
+        bucket.backoff(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+    # the repo is left out of the stage's checkpoint and probed again on the next run
+    raise Exception(f"{res.status_code} after {max_retries} attempts: {res.url}")
+
+
+def check_playstore(app: MyApp, store_session: Session, bucket: TokenBucket, playstore_url: str):
+    res = probe_store(store_session, bucket, playstore_url, {"id": app.app_identifier})
+    if res.ok:
+        app.playstore_url = res.url
+    elif res.status_code != 404:
+        raise Exception(f"{res.status_code} {res.url}: {res.text[:200]}")
+
+
+def check_fdroid(app: MyApp, store_session: Session, bucket: TokenBucket, fdroid_url: str):
+    res = probe_store(store_session, bucket, fdroid_url + app.app_identifier)
+    if res.ok:
+        app.fdroid_url = res.url
+    elif res.status_code != 404:
+        raise Exception(f"{res.status_code} {res.url}: {res.text[:200]}")
+
+
+def identified_apps(repo: MyRepository) -> list[MyApp]:
+    if repo.build_gradle_files is None:
+        get_repo_files(repo)
+    if any(app.app_identifier is None for app in repo.apps):
+        get_app_identifiers(repo)
+    return [app for app in repo.apps if app.app_identifier]
+
+def check_repo_stores(repo: MyRepository, store_session: Session, playstore_bucket: TokenBucket, fdroid_bucket: TokenBucket, playstore_url: str = PLAYSTORE_URL, fdroid_url: str = FDROID_URL):
+    if repo.is_flutter:
+        for app in identified_apps(repo):
+            if app.playstore_url is None:
+                check_playstore(app, store_session, playstore_bucket, playstore_url)
+            if app.fdroid_url is None:
+                check_fdroid(app, store_session, fdroid_bucket, fdroid_url)
+    return repo
+
+def check_stores(repos: list[MyRepository], workers: int = 16, rate: float = 10, playstore_url: str = PLAYSTORE_URL, fdroid_url: str = FDROID_URL):
     flutter_repos = [repo for repo in repos if repo.is_flutter]
     print(f"checking {len(flutter_repos)} repos")
-    playstore_session = session()
-    fdroid_session = session()
-    failed_repos = []
+    failed = []
+    apps = []
     for repo in tqdm(flutter_repos):
         try:
-            if repo.build_gradle_files is None:
-                get_build_gradle_files(repo)
-            for app in repo.apps:
-                if app.app_identifier is None:
-                    get_app_identifiers(repo)
-                if not app.app_identifier:
-                    continue
-                if app.playstore_url is None:
-                    res = playstore_session.get(PLAYSTORE_URL, params={"id": app.app_identifier})
-                    sleep(0.1)
-                    if res.ok:
-                        app.playstore_url = res.url
-                    elif res.status_code == 404:
-                        pass
-                    elif res.status_code == 500:
-                        failed_repos.append(repo)
-                    else:
-                        print(res.status_code, res.text, res.url)
-                if app.fdroid_url is None:
-                    res = fdroid_session.get(FDROID_URL + app.app_identifier)
-                    if res.ok:
-                        app.fdroid_url = res.url
-                    elif res.status_code == 404:
-                        pass
-                    else:
-                        print(res.status_code, res.text, res.url)
+            apps.extend((repo, app) for app in identified_apps(repo))
         except Exception as e:
             print(e)
-    
-    # retry if rate-limiting leads to errors
-    sleep(60)
-    if len(failed_repos) > 0:
-        check_stores(failed_repos)
-    return repos
-
-
-def check_playstore_metadata(repos: list[MyRepository]):
-    playstore_apps = [app for repo in repos for app in repo.apps if app.playstore_url]
-    playstore_session = session()
-    for app in tqdm(playstore_apps):
-        try:
-            res = playstore_session.get(app.playstore_url)
-            if res.ok:
-                soup = BeautifulSoup(res.text)
-                m = re.search(r"([\d]+?)([KMB]?)\+Downloads", soup.text)
-                downloads = int(m[1])
-                if m[2] == "K":
-                    downloads *= int(1e3)
-                elif m[2] == "M":
-                    downloads *= int(1e6)
-                elif m[2] == "B":
-                    downloads *= int(1e9)
-                app.playstore_downloads = downloads
-                m = re.search(r"About this (?:app|game)arrow_forward(.+?)Updated on(\w{3} \d{1,2}, \d{4})", soup.text)
-                app.playstore_description = m[1]
-                app.playstore_updated = m[2]
-            elif res.status_code == 404:
-                print(app.playstore_url, "404 error")    
-        except Exception as e:
-            print(app.playstore_url, e)
-    return repos
+            failed.append(repo)
+
+    # both stores are probed concurrently, each host with its own rate limit and backoff, retries are per app
+    store_session = new_session(workers)
+    playstore_bucket = TokenBucket(rate)
+    fdroid_bucket = TokenBucket(rate)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for repo, app in apps:
+            if app.playstore_url is None:
+                futures[executor.submit(check_playstore, app, store_session, playstore_bucket, playstore_url)] = repo
+            if app.fdroid_url is None:
+                futures[executor.submit(check_fdroid, app, store_session, fdroid_bucket, fdroid_url)] = repo
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                print(e)
+                failed.append(futures[future])
+    return repos, failed
+
+
+PLAYSTORE_DOWNLOADS = re.compile(r">\s*(\d+)([KMB]?)\+\s*</div>\s*<div[^>]*>\s*Downloads\s*<")
+PLAYSTORE_UPDATED = re.compile(r">\s*Updated on\s*</div>\s*<div[^>]*>\s*(\w{3} \d{1,2}, \d{4})\s*<")
+PLAYSTORE_DESCRIPTION = re.compile(r'<div[^>]*data-g-id="description"[^>]*>(.*?)</div>', re.DOTALL)
+LD_JSON = re.compile(r'<script[^>]*type="application/ld\+json"[^>]*>(.*?)</script>', re.DOTALL)
+DOWNLOAD_UNITS = {"": 1, "K": int(1e3), "M": int(1e6), "B": int(1e9)}
+PARSE_POOL: Optional[ProcessPoolExecutor] = None
+PARSE_POOL_LOCK = Lock()
+
+# full page text like the first version of the parser, only used when the targeted parser doesn't find its elements
+def parse_playstore_page_soup(page: str):
+    soup = BeautifulSoup(page, "html.parser")
+    m = re.search(r"([\d]+?)([KMB]?)\+Downloads", soup.text)
+    downloads = int(m[1]) * DOWNLOAD_UNITS[m[2]]
+    m = re.search(r"About this (?:app|game)arrow_forward(.+?)Updated on(\w{3} \d{1,2}, \d{4})", soup.text)
+    return downloads, m[1], m[2]
+
+# returns (downloads, description, updated) by matching only the download count, "Updated on" and description elements
+# instead of building and flattening the whole document. The description falls back to the ld+json metadata
+def parse_playstore_page(page: str):
+    downloads = PLAYSTORE_DOWNLOADS.search(page)
+    updated = PLAYSTORE_UPDATED.search(page)
+    description = PLAYSTORE_DESCRIPTION.search(page)
+    if description:
+        # tags are dropped without separator, like the text of the description element
+        description = html.unescape(re.sub(r"<[^>]+>", "", description[1]))
+    else:
+        for m in LD_JSON.finditer(page):
+            try:
+                data = json.loads(m[1])
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and data.get("@type") == "SoftwareApplication":
+                description = data.get("description")
+                break
+    if not downloads or not updated or description is None:
+        return parse_playstore_page_soup(page)
+    return int(downloads[1]) * DOWNLOAD_UNITS[downloads[2]], description, updated[1]
+
+def parse_pool() -> ProcessPoolExecutor:
+    # parsing is CPU bound, it runs in worker processes while the threads wait on the network.
+    # forkserver because the pool is started from a process that already runs threads
+    global PARSE_POOL
+    with PARSE_POOL_LOCK:
+        if PARSE_POOL is None:
+            PARSE_POOL = ProcessPoolExecutor(mp_context=get_context("forkserver"))
+    return PARSE_POOL
+
+def get_playstore_metadata(app: MyApp, playstore_session: Session, bucket: TokenBucket):
+    res = probe_store(playstore_session, bucket, app.playstore_url)
+    if res.ok:
+        app.playstore_downloads, app.playstore_description, app.playstore_updated = parse_pool().submit(parse_playstore_page, res.text).result()
+    elif res.status_code == 404:
+        print(app.playstore_url, "404 error")
+    else:
+        raise Exception(f"{res.status_code} {res.url}")
+
+def check_playstore_metadata(repos: list[MyRepository], workers: int = 8, rate: float = 10):
+    playstore_apps = [(repo, app) for repo in repos for app in repo.apps if app.playstore_url]
+    playstore_session = new_session(workers)
+    bucket = TokenBucket(rate)
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(get_playstore_metadata, app, playstore_session, bucket): repo for repo, app in playstore_apps}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                future.result()
+            except Exception as e:
+                print(futures[future].repository.full_name, e)
+                failed.append(futures[future])
+    return repos, failed
 
 
 def export_csv(repos: list[MyRepository], name: str):
@@ -220,27 +503,37 @@ def export_csv(repos: list[MyRepository], name: str):
         w.writerows(rows)
 
 
-def export_sqlite(repos: list[MyRepository], name: str):
+def export_sqlite(repos: Iterable[MyRepository], name: str):
     with open("create_db.sql") as f:
         create_db_script = f.read()
     connection = sqlite3.connect(name, autocommit=True)
     connection.executescript(create_db_script)
 
-    rows = [[
-        repo.repository.full_name,
-        repo.repository.html_url,
-        repo.repository.stargazers_count,
-        repo.repository.description,
-        app.app_identifier,
-        app.path,
-        app.pubspec.path,
-        app.playstore_url,
-        app.playstore_downloads,
-        app.playstore_updated,
-        app.playstore_description
-    ] for repo in repos for app in repo.apps]
+    # rows are upserted per repo, so that a streamed pipeline exports repos as they arrive
+    for repo in repos:
+        rows = [[
+            repo.repository.full_name,
+            repo.repository.html_url,
+            repo.repository.stargazers_count,
+            repo.repository.description,
+            app.app_identifier,
+            app.path,
+            app.pubspec.path,
+            app.playstore_url,
+            app.playstore_downloads,
+            app.playstore_updated,
+            app.playstore_description
+        ] for app in repo.apps]
+        try:
+            export_rows(connection, rows)
+        except sqlite3.IntegrityError as e:
+            print(repo.repository.full_name, e)
+    connection.close()
+
+def export_rows(connection: sqlite3.Connection, rows: list[list]):
+    # upsert keeps the app id, commit_sha and analyzed of apps that reposcanner already saw
     connection.executemany("""
-        REPLACE INTO app (
+        INSERT INTO app (
             "github_name",
             "github_repo",
             "github_stars",
@@ -252,101 +545,433 @@ def export_sqlite(repos: list[MyRepository], name: str):
             "playstore_downloads",
             "playstore_updated",
             "playstore_description"
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT ("github_repo") DO UPDATE SET
+            "github_name" = excluded."github_name",
+            "github_stars" = excluded."github_stars",
+            "github_description" = excluded."github_description",
+            "package_id" = excluded."package_id",
+            "path" = excluded."path",
+            "pubspec_path" = excluded."pubspec_path",
+            "playstore_url" = excluded."playstore_url",
+            "playstore_downloads" = excluded."playstore_downloads",
+            "playstore_updated" = excluded."playstore_updated",
+            "playstore_description" = excluded."playstore_description";
         """, 
         rows
     )
-    connection.close()
 
 
-def dedup_repos(repos: list[Repository]) -> list[Repository]:
-    seen = set()
-    repos_dedup = []
-    for repo in repos:
-        if repo.full_name not in seen:
-            repos_dedup.append(repo)
-            seen.add(repo.full_name)
-    return repos_dedup
+def repo_to_record(repo: MyRepository) -> str:
+    # file contents are bytes, surrogateescape keeps non UTF-8 content intact
+    return json.dumps(asdict(repo), default=lambda content: content.decode("utf-8", "surrogateescape"))
+
+def repo_from_record(record: str) -> MyRepository:
+    data = json.loads(record)
+    def to_file(file):
+        return MyFile(file["path"], file["decoded_content"].encode("utf-8", "surrogateescape"))
+    def to_files(files):
+        return None if files is None else [to_file(file) for file in files]
+    return MyRepository(
+        RepoInfo(**data["repository"]),
+        None if data["git_tree"] is None else [TreeEntry(**entry) for entry in data["git_tree"]],
+        data["is_flutter"],
+        to_files(data["pubspecs"]),
+        to_files(data["android_manifests"]),
+        to_files(data["build_gradle_files"]),
+        None if data["apps"] is None else [MyApp(**(app | {"pubspec": to_file(app["pubspec"]), "android_manifest": to_file(app["android_manifest"])})) for app in data["apps"]],
+    )
 
-def save_repos(repos, name):
-    with open(name, "wb") as f: 
-        pickle.dump(repos, f)
+def repo_from_legacy(repo) -> MyRepository:
+    # MyRepository from an old pickle snapshot that still holds PyGithub objects
+    def to_files(files):
+        return None if files is None else [MyFile(file.path, file.decoded_content) for file in files]
+    return MyRepository(
+        RepoInfo.from_repository(repo.repository),
+        None if repo.git_tree is None else [TreeEntry(entry.path, entry.type, entry.sha) for entry in repo.git_tree.tree],
+        repo.is_flutter,
+        to_files(repo.pubspecs),
+        to_files(repo.android_manifests),
+        to_files(repo.build_gradle_files),
+        None if repo.apps is None else [
+            MyApp(app.path, MyFile(app.pubspec.path, app.pubspec.decoded_content), MyFile(app.android_manifest.path, app.android_manifest.decoded_content),
+                  app.app_identifier, app.playstore_url, app.fdroid_url, app.playstore_downloads, app.playstore_description, app.playstore_updated)
+            for app in repo.apps
+        ],
+    )
 
-def load_repos(path) -> list[MyRepository]:
-    with open(path, "rb") as f:
-        return pickle.load(f)
 
+class StageStore:
+    # one record per repo in SQLite, written while a stage runs so that an interrupted stage resumes after the last processed repo
+    def __init__(self, path: str):
+        # pipeline --stream writes from the threads of several stages, the lock keeps their transactions apart
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = Lock()
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS "repo" (
+                "id"	INTEGER PRIMARY KEY AUTOINCREMENT,
+                "full_name"	TEXT NOT NULL UNIQUE,
+                "record"	TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS "processed" (
+                "full_name"	TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS "search_range" (
+                "stars"	TEXT NOT NULL,
+                "created"	TEXT,
+                "total"	INTEGER NOT NULL,
+                "done"	BOOLEAN NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS "search_result" (
+                "full_name"	TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS "dropped" (
+                "full_name"	TEXT PRIMARY KEY,
+                "outcome"	TEXT NOT NULL
+            );
+        """)
+
+    def put(self, repos: Iterable[MyRepository], processed: Iterable[MyRepository] = ()):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT INTO repo (full_name, record) VALUES (?, ?) ON CONFLICT ("full_name") DO UPDATE SET record = excluded.record',
+                [(repo.repository.full_name, repo_to_record(repo)) for repo in repos]
+            )
+            self.connection.executemany("INSERT OR IGNORE INTO processed (full_name) VALUES (?)", [(repo.repository.full_name,) for repo in processed])
+
+    # repos a stage ruled out count as processed, with the reason in `dropped`
+    def drop(self, repos: Iterable[MyRepository], outcome: str):
+        full_names = [(repo.repository.full_name,) for repo in repos]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO processed (full_name) VALUES (?)", full_names)
+            self.connection.executemany("REPLACE INTO dropped (full_name, outcome) VALUES (?, ?)", [(full_name, outcome) for full_name, in full_names])
+
+    def search_ranges(self) -> list[tuple[str, Optional[str], int, bool]]:
+        return [(stars, created, total, bool(done)) for stars, created, total, done in self.connection.execute("SELECT stars, created, total, done FROM search_range ORDER BY rowid")]
+
+    def save_search_ranges(self, ranges: list[tuple[str, Optional[str], int, bool]]):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT INTO search_range (stars, created, total, done) VALUES (?, ?, ?, ?)", ranges)
+
+    def finish_search_range(self, search_range: tuple[str, Optional[str], int], full_names: list[str]):
+        stars, created, _ = search_range
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO search_result (full_name) VALUES (?)", [(full_name,) for full_name in full_names])
+            self.connection.execute("UPDATE search_range SET done = 1 WHERE stars = ? AND created IS ?", (stars, created))
+
+    def search_results(self) -> set[str]:
+        return {full_name for (full_name,) in self.connection.execute("SELECT full_name FROM search_result")}
+
+    def processed(self) -> set[str]:
+        return {full_name for (full_name,) in self.connection.execute("SELECT full_name FROM processed")}
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM repo").fetchone()[0]
+
+    def __iter__(self) -> Iterator[MyRepository]:
+        for (record,) in self.connection.execute("SELECT record FROM repo ORDER BY id"):
+            yield repo_from_record(record)
+
+
+def load_repos(path) -> Iterable[MyRepository]:
+    if path.endswith(".pickle"):
+        with open(path, "rb") as f:
+            return [repo_from_legacy(repo) for repo in pickle.load(f)]
+    return StageStore(path)
+
+def run_stage(stage, path: str, output_path: str, chunk_size: int = 50):
+    # stages run on chunks of repos, each chunk is checkpointed in the output store before the next one starts.
+    # stages return the repos they failed on (API or store errors), those are left out so that a rerun retries them
+    output = StageStore(output_path)
+    processed = output.processed()
+    failures = 0
+    def checkpoint(chunk: list[MyRepository]):
+        repos, failed = stage(chunk)
+        failed = {repo.repository.full_name for repo in failed}
+        output.put([repo for repo in repos if repo.repository.full_name not in failed], [repo for repo in chunk if repo.repository.full_name not in failed])
+        return len(failed)
+    chunk = []
+    for repo in load_repos(path):
+        if repo.repository.full_name in processed:
+            continue
+        chunk.append(repo)
+        if len(chunk) == chunk_size:
+            failures += checkpoint(chunk)
+            chunk = []
+    if chunk:
+        failures += checkpoint(chunk)
+    if failures:
+        print(f"{failures} repos failed and were not checkpointed, rerun the stage to retry them")
+    return output
+
+
+SEARCH_LIMIT = 1000
+SEARCH_PAGE_SIZE = 100
+SEARCH_START = date(2008, 1, 1)
+# GitHub allows 30 search requests per minute
+SEARCH_BUCKET = TokenBucket(30 / 60)
+
+def count_api_call(stats: dict):
+    with stats["lock"]:
+        stats["api_calls"] += 1
+
+def search_dart_repos(stars: str, created: Optional[str], stats: dict, sort: str = "stars", order: str = "asc"):
+    qualifiers = {"stars": stars} | ({"created": created} if created else {})
+    SEARCH_BUCKET.acquire()
+    count_api_call(stats)
+    repos_paginated = github().search_repositories("", sort=sort, order=order, language="Dart", **qualifiers)
+    return repos_paginated, repos_paginated.totalCount
+
+def plan_created_ranges(stars: str, stats: dict) -> list[tuple[str, str, int]]:
+    # a single star count with more than 1000 repos is split further by creation date
+    ranges = []
+    pending = [(SEARCH_START, date.today())]
+    while pending:
+        start, end = pending.pop()
+        created = f"{start.isoformat()}..{end.isoformat()}"
+        _, total = search_dart_repos(stars, created, stats)
+        if total <= SEARCH_LIMIT or start == end:
+            if total > SEARCH_LIMIT:
+                print(f"more than {SEARCH_LIMIT} repos with stars:{stars} created:{created}, results are incomplete")
+            if total:
+                ranges.append((stars, created, total))
+            continue
+        mid = start + (end - start) / 2
+        pending += [(start, mid), (mid + timedelta(days=1), end)]
+    return ranges
+
+def plan_search_ranges(min_stars: int, stats: dict) -> list[tuple[str, Optional[str], int]]:
+    # disjoint star ranges with at most 1000 results each, split geometrically since most repos have few stars
+    repos_paginated, total = search_dart_repos(f">={min_stars}", None, stats, order="desc")
+    if total == 0:
+        return []
+    max_stars = repos_paginated[0].stargazers_count
+    ranges = []
+    pending = [(min_stars, max_stars)]
+    while pending:
+        low, high = pending.pop()
+        stars = f"{low}..{high}"
+        _, total = search_dart_repos(stars, None, stats)
+        if total <= SEARCH_LIMIT:
+            if total:
+                ranges.append((stars, None, total))
+        elif low == high:
+            ranges += plan_created_ranges(stars, stats)
+        else:
+            mid = min(high - 1, max(low, int((low * high) ** 0.5)))
+            pending += [(low, mid), (mid + 1, high)]
+    return ranges
 
-def fetch_github_repos(min_stars):
-    cur_min_stars = min_stars
+def fetch_search_range(search_range: tuple[str, Optional[str], int], stats: dict) -> list[Repository]:
+    stars, created, total = search_range
+    repos_paginated, _ = search_dart_repos(stars, created, stats)
     repos = []
-    while True:
-        repos_paginated = G.search_repositories("", sort="stars", order="asc", language="Dart", stars=f">={cur_min_stars}")
-        repos.extend(tqdm(repos_paginated))
-        print(f"{repos_paginated.totalCount=}")
-        print(f"{len(repos)=}")
-        if (repos_paginated.totalCount > 1000):
-            cur_min_stars = repos[-1].stargazers_count
-        else:
+    for page in range(-(-min(total, SEARCH_LIMIT) // SEARCH_PAGE_SIZE)):
+        SEARCH_BUCKET.acquire()
+        count_api_call(stats)
+        items = repos_paginated.get_page(page)
+        repos += items
+        if len(items) < SEARCH_PAGE_SIZE:
             break
-    repos = dedup_repos(repos)
-    repos = [MyRepository(repo, repo.get_git_tree(repo.default_branch, recursive=True)) for repo in tqdm(repos)]
-    print(f"found repos: {len(repos)}")
     return repos
-    
 
+def search_github_repos(min_stars, frontier: Optional[StageStore] = None, skip: set[str] = frozenset(), workers: int = 4) -> Iterator[Repository]:
+    # the planned ranges and the repos found so far are persisted in the frontier store, an interrupted search resumes with the remaining ranges
+    stats = {"api_calls": 0, "lock": Lock()}
+    ranges = frontier.search_ranges() if frontier is not None else []
+    if not ranges:
+        ranges = [(*search_range, False) for search_range in plan_search_ranges(int(min_stars), stats)]
+        if frontier is not None:
+            frontier.save_search_ranges(ranges)
+    seen = set(skip)
+    if frontier is not None:
+        for full_name in frontier.search_results() - seen - frontier.processed():
+            seen.add(full_name)
+            count_api_call(stats)
+            yield github().get_repo(full_name)
+    pending = [(stars, created, total) for stars, created, total, done in ranges if not done]
+    print(f"searching {len(pending)} of {len(ranges)} star ranges")
+    for search_range, repos in stream_stage(lambda search_range: (search_range, fetch_search_range(search_range, stats)), pending, workers):
+        new_repos = [repo for repo in repos if repo.full_name not in seen]
+        if frontier is not None:
+            frontier.finish_search_range(search_range, [repo.full_name for repo in new_repos])
+        for repo in new_repos:
+            seen.add(repo.full_name)
+            yield repo
+    found = len(seen - skip)
+    print(f"search api calls: {stats['api_calls']}, repos found: {found}, calls per repo: {stats['api_calls'] / max(found, 1):.3f}")
+
+def probe_entries(depth: int) -> str:
+    # names of the entries of every directory down to `depth` levels below the root
+    fields = "name"
+    for _ in range(depth):
+        fields = f"name type object {{ ... on Tree {{ entries {{ {fields} }} }} }}"
+    return fields
+
+PROBE_FRAGMENT = f"""
+fragment probe on Repository {{
+    pubspec: object(expression: "HEAD:pubspec.yaml") {{ ... on Blob {{ text }} }}
+    tree: object(expression: "HEAD:") {{ ... on Tree {{ entries {{ {probe_entries(PROBE_DEPTH)} }} }} }}
+}}
+"""
+
+def has_nested_pubspec(entries: list[dict], depth: int) -> bool:
+    for entry in entries:
+        if entry.get("type") != "tree" or not entry.get("object"):
+            continue
+        sub_entries = entry["object"]["entries"]
+        if any(sub_entry["name"] == "pubspec.yaml" for sub_entry in sub_entries):
+            return True
+        if depth > 1 and has_nested_pubspec(sub_entries, depth - 1):
+            return True
+    return False
+
+def is_flutter_candidate(probe: Optional[dict]) -> bool:
+    # a flutter pubspec in the root, or any pubspec.yaml in the first PROBE_DEPTH directory levels
+    if probe is None:
+        return False
+    if probe["pubspec"] and FLUTTER_SDK_PATTERN.search(probe["pubspec"]["text"] or ""):
+        return True
+    return has_nested_pubspec((probe["tree"] or {}).get("entries", []), PROBE_DEPTH)
+
+def probe_flutter_candidates(repos: list[Repository]) -> list[bool]:
+    # root pubspec and the top of the tree for a batch of repos in one GraphQL query, instead of a recursive tree per repo
+    params = "".join(f"$owner{i}: String!, $name{i}: String!, " for i in range(len(repos)))
+    fields = "".join(f" r{i}: repository(owner: $owner{i}, name: $name{i}) {{ ...probe }}" for i in range(len(repos)))
+    query = f"query({params.rstrip(', ')}) {{{fields} }}" + PROBE_FRAGMENT
+    variables = {}
+    for i, repo in enumerate(repos):
+        variables[f"owner{i}"], variables[f"name{i}"] = repo.full_name.split("/", 1)
+    try:
+        _, data = github().requester.graphql_query(query, variables)
+    except Exception as e:
+        print(e)
+        return [True] * len(repos)
+    return [is_flutter_candidate(data["data"][f"r{i}"]) for i in range(len(repos))]
+
+def fetch_github_repos(min_stars, frontier: Optional[StageStore] = None, skip: set[str] = frozenset(), prefilter: bool = True) -> Iterator[MyRepository]:
+    # full trees are not fetched here, check_flutter fetches them lazily for the repos that pass the pre-filter
+    stats = {"probed": 0, "dropped": 0}
+    def prefiltered(batch: list[Repository]):
+        candidates = probe_flutter_candidates(batch) if prefilter else [True] * len(batch)
+        stats["probed"] += len(batch)
+        stats["dropped"] += candidates.count(False)
+        if frontier is not None:
+            frontier.drop([MyRepository(RepoInfo.from_repository(repo)) for repo, candidate in zip(batch, candidates) if not candidate], "prefilter")
+        return [MyRepository(RepoInfo.from_repository(repo)) for repo, candidate in zip(batch, candidates) if candidate]
+    batch = []
+    for repo in search_github_repos(min_stars, frontier, skip):
+        batch.append(repo)
+        if len(batch) == PROBE_BATCH_SIZE:
+            yield from prefiltered(batch)
+            batch = []
+    if batch:
+        yield from prefiltered(batch)
+    if prefilter:
+        print(f"pre-filter dropped {stats['dropped']} of {stats['probed']} repos without a pubspec.yaml in the first {PROBE_DEPTH} directory levels, --no-prefilter checks them too")
+
+
+STREAM_DONE = object()
+
+def stream_stage(fn, items: Iterable, workers: int) -> Iterator:
+    # pulls from its upstream in its own thread with at most `workers` items in flight and a bounded output queue,
+    # so every repo flows through all stages as soon as it is fetched and memory stays flat. fn returning None drops the item
+    output = Queue(maxsize=workers * 2)
+    slots = Semaphore(workers)
+    errors = []
+    def run(item):
+        try:
+            result = fn(item)
+            if result is not None:
+                output.put(result)
+        except Exception as e:
+            print(e)
+        finally:
+            slots.release()
+    def feed():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for item in items:
+                    slots.acquire()
+                    executor.submit(run, item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            output.put(STREAM_DONE)
+    Thread(target=feed, daemon=True).start()
+    while (result := output.get()) is not STREAM_DONE:
+        yield result
+    if errors:
+        raise errors[0]
+
+def stream_pipeline(min_stars, output_db: str, store: StageStore, frontier: StageStore, workers: int = 8, rate: float = 10, prefilter: bool = True):
+    store_session = new_session(workers)
+    playstore_bucket = TokenBucket(rate)
+    fdroid_bucket = TokenBucket(rate)
+    playstore_session = new_session(workers)
+    metadata_bucket = TokenBucket(rate)
+    def check_meta(repo: MyRepository):
+        for app in repo.apps:
+            if app.playstore_url:
+                get_playstore_metadata(app, playstore_session, metadata_bucket)
+        return repo
+    # repos the filter drops never reach the store, they are recorded in the frontier so that a resumed search skips them instead of fetching them again
+    def filter_or_drop(repo: MyRepository):
+        filtered = filter_repo(repo)
+        if filtered is None:
+            frontier.drop([repo], "filter: not one app" if repo.is_flutter else "filter: not flutter")
+        return filtered
+    repos = fetch_github_repos(min_stars, frontier, store.processed(), prefilter)
+    repos = stream_stage(check_flutter_repo, repos, workers)
+    repos = stream_stage(filter_or_drop, repos, workers)
+    repos = stream_stage(lambda repo: check_repo_stores(repo, store_session, playstore_bucket, fdroid_bucket), repos, workers)
+    repos = stream_stage(check_meta, repos, workers)
+    def checkpoint(repos):
+        for repo in repos:
+            store.put([repo], [repo])
+            yield repo
+    export_sqlite(checkpoint(repos), output_db)
 
-if __name__ == '__main__':
-    GH_TOKEN = os.getenv("GITHUB_TOKEN")
-    G = Github(auth=Auth.Token(GH_TOKEN), per_page=100)
 
+if __name__ == '__main__':
     argparser = ArgumentParser()
     argparser.add_argument("command", choices=["fetch", "check", "stores", "play_meta", "filter", "export_csv", "export_sqlite", "pipeline"])
     argparser.add_argument("args", nargs="*")
     argparser.add_argument("-o", "--output")
+    argparser.add_argument("--cache", default="http_cache.db", help="on-disk cache for GitHub and store responses, empty to disable")
+    argparser.add_argument("--cache-ttl", type=float, default=24, help="hours a cached response is used without revalidation")
+    argparser.add_argument("--stream", action="store_true", help="pipeline: pass every repo through all stages as soon as it is fetched instead of running the stages one after another")
+    argparser.add_argument("--prefilter", action=BooleanOptionalAction, default=True, help=f"fetch/pipeline: drop repos without a pubspec.yaml in the first {PROBE_DEPTH} directory levels before fetching their trees")
+    argparser.add_argument("-w", "--workers", type=int, default=8, help="pipeline --stream: concurrent repos per stage")
+    argparser.add_argument("--local", help="check: read the trees and files from local bare clones in LOCAL/<owner>/<name>.git (e.g. the mirrors of reposcanner.py) instead of the API")
 
     args = argparser.parse_args()
+    if args.cache:
+        HTTP_CACHE = ResponseCache(args.cache, fresh_ttl=args.cache_ttl * 3600)
+        install_github_cache(HTTP_CACHE)
+
     output_name = args.output
 
     if args.command == "fetch":
         min_stars = args.args[0]
-        repos = fetch_github_repos(min_stars)
         if not output_name:
             d = datetime.now().replace(microsecond=0).isoformat()
-            output_name = f"repos-{min_stars}-stars-{d}.pickle"
-        save_repos(repos, output_name)
-    elif args.command == "check":
+            output_name = f"repos-{min_stars}-stars-{d}.stage"
+        output = StageStore(output_name)
+        for repo in fetch_github_repos(min_stars, output, output.processed(), args.prefilter):
+            output.put([repo], [repo])
+    elif args.command in ("check", "stores", "play_meta", "filter"):
+        stage, suffix = {
+            "check": (partial(check_flutter, local_dir=args.local), "-flutter"),
+            "stores": (check_stores, "-stores"),
+            "play_meta": (check_playstore_metadata, "-play_meta"),
+            "filter": (filter, "-filtered"),
+        }[args.command]
         path = args.args[0]
-        repos = load_repos(path)
-        flutter_repos = check_flutter(repos)
         if not output_name:
             output_name, _ = os.path.splitext(os.path.basename(path))
-            output_name += "-flutter.pickle"
-        save_repos(repos, output_name)
-    elif args.command == "stores":
-        path = args.args[0]
-        repos = load_repos(path)
-        flutter_repos = check_stores(repos)
-        if not output_name:
-            output_name, _ = os.path.splitext(os.path.basename(path))
-            output_name += "-stores.pickle"
-        save_repos(repos, output_name)
-    elif args.command == "play_meta":
-        path = args.args[0]
-        repos = load_repos(path)
-        flutter_repos = check_playstore_metadata(repos)
-        if not output_name:
-            output_name, _ = os.path.splitext(os.path.basename(path))
-            output_name += "-play_meta.pickle"
-        save_repos(repos, output_name)
-    elif args.command == "filter":
-        path = args.args[0]
-        repos = load_repos(path)
-        filtered_repos = filter(repos)
-        if not output_name:
-            output_name, _ = os.path.splitext(os.path.basename(path))
-            output_name += "-filtered.pickle"
-        save_repos(filtered_repos, output_name)
+            output_name += f"{suffix}.stage"
+        run_stage(stage, path, output_name)
     elif args.command == "export_csv":
         path = args.args[0]
         repos = load_repos(path)
@@ -364,14 +989,18 @@ if __name__ == '__main__':
     elif args.command == "pipeline":
         min_stars = args.args[0]
         output_db = args.args[1]
-        repos = fetch_github_repos(min_stars)
-        repos = check_flutter(repos)
-        repos = filter(repos)
-        repos = check_stores(repos)
-        repos = check_playstore_metadata(repos)
+        # every stage is checkpointed in its own store, rerunning with the same -o resumes an interrupted pipeline
         if not output_name:
             d = datetime.now().replace(microsecond=0).isoformat()
-            output_name = f"repos-{min_stars}-stars-{d}.pickle"
-        save_repos(repos, output_name)
-        export_sqlite(repos, output_db)
-
+            output_name = f"repos-{min_stars}-stars-{d}"
+        if args.stream:
+            stream_pipeline(min_stars, output_db, StageStore(f"{output_name}-play_meta.stage"), StageStore(f"{output_name}.stage"), args.workers, prefilter=args.prefilter)
+        else:
+            fetched = StageStore(f"{output_name}.stage")
+            for repo in fetch_github_repos(min_stars, fetched, fetched.processed(), args.prefilter):
+                fetched.put([repo], [repo])
+            run_stage(check_flutter, f"{output_name}.stage", f"{output_name}-flutter.stage")
+            run_stage(filter, f"{output_name}-flutter.stage", f"{output_name}-filtered.stage")
+            run_stage(check_stores, f"{output_name}-filtered.stage", f"{output_name}-stores.stage")
+            repos = run_stage(check_playstore_metadata, f"{output_name}-stores.stage", f"{output_name}-play_meta.stage")
+            export_sqlite(repos, output_db)
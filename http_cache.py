@@ -0,0 +1,151 @@
+import sqlite3, json, hashlib
+from http import HTTPStatus
+from threading import Lock
+from time import time
+
+from requests import Response, PreparedRequest
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from github.Requester import Requester, HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
+
+CACHEABLE_STATUS = (200, 301, 302, 404)
+# headers of the original response that don't apply to the stored, already decoded body
+DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+
+class ResponseCache:
+    # on-disk cache of HTTP responses shared by the PyGithub connections and the store sessions
+    def __init__(self, path: str, fresh_ttl: float = 24 * 3600, max_age: float = 30 * 24 * 3600, max_size: int = 1 << 30):
+        self.fresh_ttl = fresh_ttl
+        self.max_age = max_age
+        self.max_size = max_size
+        self.lock = Lock()
+        self.stores = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS "response" (
+                "key"	TEXT PRIMARY KEY,
+                "url"	TEXT NOT NULL,
+                "status"	INTEGER NOT NULL,
+                "headers"	TEXT NOT NULL,
+                "body"	BLOB NOT NULL,
+                "etag"	TEXT,
+                "last_modified"	TEXT,
+                "stored_at"	REAL NOT NULL,
+                "accessed_at"	REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS "response_accessed_at" ON "response" ("accessed_at");
+        """)
+
+    @staticmethod
+    def key(request: PreparedRequest):
+        body = request.body.encode() if isinstance(request.body, str) else request.body or b""
+        accept = request.headers.get("Accept", "")
+        return hashlib.sha256(b"\0".join([request.method.encode(), request.url.encode(), accept.encode(), body])).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.connection.execute("SELECT status, headers, body, etag, last_modified, stored_at FROM response WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.connection.execute("UPDATE response SET accessed_at = ? WHERE key = ?", (time(), key))
+        return row
+
+    def put(self, key: str, response: Response):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS}
+        with self.lock:
+            self.connection.execute(
+                "REPLACE INTO response (key, url, status, headers, body, etag, last_modified, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, response.url, response.status_code, json.dumps(headers), response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"), time(), time())
+            )
+            self.stores += 1
+            if self.stores % 100 == 0:
+                self.evict()
+
+    def touch(self, key: str):
+        with self.lock:
+            self.connection.execute("UPDATE response SET stored_at = ?, accessed_at = ? WHERE key = ?", (time(), time(), key))
+
+    def evict(self):
+        # drop expired entries, then least recently used ones until the cache fits into max_size
+        self.connection.execute("DELETE FROM response WHERE stored_at < ?", (time() - self.max_age,))
+        size = self.connection.execute("SELECT coalesce(sum(length(body)), 0) FROM response").fetchone()[0]
+        if size > self.max_size:
+            cursor = self.connection.execute("SELECT key, length(body) FROM response ORDER BY accessed_at")
+            evicted = []
+            for key, length in cursor:
+                if size <= self.max_size:
+                    break
+                evicted.append((key,))
+                size -= length
+            self.connection.executemany("DELETE FROM response WHERE key = ?", evicted)
+
+
+def is_graphql(request: PreparedRequest):
+    return request.method == "POST" and request.url.endswith("/graphql")
+
+# GraphQL reports rate limits, timeouts and other failures with status 200 and an `errors` list, those must not be replayed from the cache
+def cacheable(request: PreparedRequest, response: Response):
+    if not is_graphql(request):
+        return response.status_code in CACHEABLE_STATUS
+    if response.status_code != 200:
+        return False
+    try:
+        result = response.json()
+    except ValueError:
+        return False
+    return isinstance(result, dict) and not result.get("errors") and result.get("data") is not None
+
+
+class CachingAdapter(HTTPAdapter):
+    # serves fresh responses from the cache and revalidates stale ones with If-None-Match/If-Modified-Since
+    def __init__(self, cache: ResponseCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: PreparedRequest, **kwargs):
+        # GitHub GraphQL has no conditional requests, its queries are only served while fresh
+        if request.method != "GET" and not is_graphql(request):
+            return super().send(request, **kwargs)
+        key = self.cache.key(request)
+        cached = self.cache.get(key)
+        if cached:
+            status, headers, body, etag, last_modified, stored_at = cached
+            if time() - stored_at < self.cache.fresh_ttl:
+                return self.build_cached_response(request, status, headers, body)
+            if etag:
+                request.headers["If-None-Match"] = etag
+            if last_modified:
+                request.headers["If-Modified-Since"] = last_modified
+        response = super().send(request, **kwargs)
+        if cached and response.status_code == 304:
+            self.cache.touch(key)
+            return self.build_cached_response(request, status, headers, body)
+        if cacheable(request, response):
+            self.cache.put(key, response)
+        return response
+
+    def build_cached_response(self, request: PreparedRequest, status: int, headers: str, body: bytes):
+        response = Response()
+        response.status_code = status
+        response.reason = HTTPStatus(status).phrase
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.encoding = get_encoding_from_headers(response.headers)
+        return response
+
+
+def install_github_cache(cache: ResponseCache):
+    # PyGithub creates its requests sessions internally, so its connection classes are replaced with ones mounting the cache
+    class CachingHTTPSRequestsConnectionClass(HTTPSRequestsConnectionClass):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.adapter = CachingAdapter(cache, max_retries=self.retry, pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            self.session.mount("https://", self.adapter)
+
+    Requester.injectConnectionClasses(HTTPRequestsConnectionClass, CachingHTTPSRequestsConnectionClass)
@@ -1,28 +1,230 @@
-import os, json, sqlite3, tempfile, shutil
-from os.path import realpath, isfile, dirname
-from subprocess import CalledProcessError, check_output, run, PIPE
-from argparse import ArgumentParser, BooleanOptionalAction
+import os, json, sqlite3, tempfile, shutil, hashlib, threading, fcntl, socket, random
+from os.path import realpath, isfile, isdir, dirname
+from subprocess import CalledProcessError, TimeoutExpired, check_output, run, Popen, PIPE, DEVNULL
+from argparse import ArgumentParser, ArgumentTypeError, BooleanOptionalAction
 from itertools import product
+from collections import Counter
 from copy import deepcopy
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from queue import Queue
+from dataclasses import dataclass, field
+from time import time, perf_counter, sleep
 
 from tqdm import tqdm
 import yaml
 
 
-def clone_repo(app: sqlite3.Row, repo_dir: str, commit_sha: str = None):
-    assert app["github_repo"].startswith("https://github.com/")
-    check_output(["rm", "-rf", repo_dir])
-    check_output(["git", "clone", "--recurse-submodules", "--end-of-options", app["github_repo"], repo_dir])
-    if commit_sha:
-        check_output(["git", "-C", repo_dir, "fetch", "origin", commit_sha])
-        check_output(["git", "-C", repo_dir, "checkout", commit_sha])
-    commit_sha = check_output(["git", "-C", repo_dir, "rev-parse", "HEAD"], encoding="utf-8").strip()
+@dataclass
+class StageMetrics:
+    stage: str
+    started_at: float = field(default_factory=time)
+    duration: float = None
+    # summed over the child processes of the stage, max_rss in KiB is the largest of them
+    cpu_user: float = 0.0
+    cpu_system: float = 0.0
+    max_rss: int = None
+    bytes: int = None
+    detail: str = None
+    findings: int = None
+    error: str = None
+
+    def add_child(self, rusage):
+        self.cpu_user += rusage.ru_utime
+        self.cpu_system += rusage.ru_stime
+        self.max_rss = max(self.max_rss or 0, rusage.ru_maxrss)
+
+# stage that child processes started by this worker thread are accounted to
+CURRENT_STAGE = threading.local()
+
+class ScanTrace:
+    # stages of one app, measured on its worker thread and saved by the writer thread
+    def __init__(self):
+        self.stages: list[StageMetrics] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        stage = StageMetrics(name)
+        self.stages.append(stage)
+        CURRENT_STAGE.stage = stage
+        start = perf_counter()
+        try:
+            yield stage
+        except Exception as e:
+            stage.error = str(e)[:1000]
+            raise
+        finally:
+            stage.duration = perf_counter() - start
+            CURRENT_STAGE.stage = None
+
+# waits with wait4 instead of Popen.wait, getrusage(RUSAGE_CHILDREN) can't tell apart the children of concurrent workers
+def wait_child(process: Popen):
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if stage := getattr(CURRENT_STAGE, "stage", None):
+        stage.add_child(rusage)
+    return process.returncode
+
+# check_output that is measured by wait_child, output goes through temporary files so that no pipe has to be drained
+def run_child(args: list[str], capture_stderr: bool = False, **kwargs) -> str:
+    with tempfile.TemporaryFile("w+", encoding="utf-8", errors="replace") as stdout, tempfile.TemporaryFile("w+", encoding="utf-8", errors="replace") as stderr:
+        process = Popen(args, stdout=stdout, stderr=stderr if capture_stderr else None, **kwargs)
+        wait_child(process)
+        stdout.seek(0)
+        stderr.seek(0)
+        output, error = stdout.read(), stderr.read() if capture_stderr else None
+    if process.returncode:
+        raise CalledProcessError(process.returncode, args, output, error)
+    return output
+
+def dir_size(path: str):
+    return sum(os.path.getsize(f"{root}/{name}") for root, _, names in os.walk(path) for name in names)
+
+def git_has_commit(git_dir: str, commit_sha: str):
+    return run(["git", "-C", git_dir, "cat-file", "-e", f"{commit_sha}^{{commit}}"], stdout=PIPE, stderr=PIPE).returncode == 0
+
+# bare mirror per repo that only holds the pinned commits at depth 1, refs/pinned/* keep them from being garbage collected
+def update_mirror(repo_url: str, mirror_dir: str, commit_sha: str = None):
+    if not isdir(mirror_dir):
+        run_child(["git", "init", "--quiet", "--bare", mirror_dir])
+    if not commit_sha or not git_has_commit(mirror_dir, commit_sha):
+        run_child(["git", "-C", mirror_dir, "fetch", "--quiet", "--depth=1", "--end-of-options", repo_url, commit_sha or "HEAD"])
+        commit_sha = run_child(["git", "-C", mirror_dir, "rev-parse", "FETCH_HEAD^{commit}"]).strip()
+    run_child(["git", "-C", mirror_dir, "update-ref", f"refs/pinned/{commit_sha}", commit_sha])
     return commit_sha
 
-def setup_analyzer(app: sqlite3.Row, repo_dir: str, flutter_3_7_12: str, flutter_3_27_0: str, lint_rules: list[str]):
-    check_output(["git", "-C", repo_dir, "reset", "--hard"])
-    check_output(["git", "-C", repo_dir, "clean", "-fxd"])
+# working tree that borrows objects from the mirror, an existing checkout is updated in place instead of recloned
+def checkout_from_mirror(repo_url: str, mirror_dir: str, repo_dir: str, commit_sha: str):
+    if not isdir(f"{repo_dir}/.git"):
+        run_child(["rm", "-rf", repo_dir])
+        run_child(["git", "init", "--quiet", repo_dir])
+        run_child(["git", "-C", repo_dir, "config", "remote.origin.url", repo_url])
+        with open(f"{repo_dir}/.git/objects/info/alternates", "w") as f:
+            f.write(f"{realpath(mirror_dir)}/objects\n")
+    # the shallow boundaries of the mirror have to be known, otherwise fetch tries to walk into missing parents of borrowed commits
+    shallow = set()
+    for path in (f"{mirror_dir}/shallow", f"{repo_dir}/.git/shallow"):
+        if isfile(path):
+            with open(path) as f:
+                shallow.update(f.read().split())
+    with open(f"{repo_dir}/.git/shallow", "w") as f:
+        f.writelines(f"{sha}\n" for sha in sorted(shallow))
+    run_child(["git", "-C", repo_dir, "fetch", "--quiet", "--depth=1", realpath(mirror_dir), f"refs/pinned/{commit_sha}"])
+    run_child(["git", "-C", repo_dir, "checkout", "--quiet", "--force", "--detach", commit_sha])
+    run_child(["git", "-C", repo_dir, "submodule", "update", "--quiet", "--init", "--recursive", "--force", "--depth=1"])
+
+# returns the checked out commit and the bytes fetched into the mirror
+def clone_repo(app: sqlite3.Row, repo_dir: str, mirrors_dir: str, commit_sha: str = None):
+    assert app["github_repo"].startswith("https://github.com/")
+    mirror_dir = f"{mirrors_dir}/{app['github_repo'].removeprefix('https://github.com/')}.git"
+    os.makedirs(dirname(mirror_dir), exist_ok=True)
+    # apps of one repo may be cloned by several jobs or worker processes sharing repos_dir, one fetch per mirror at a time
+    with open(f"{mirror_dir}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        mirror_size = dir_size(mirror_dir)
+        commit_sha = update_mirror(app["github_repo"], mirror_dir, commit_sha)
+    checkout_from_mirror(app["github_repo"], mirror_dir, repo_dir, commit_sha)
+    return commit_sha, dir_size(mirror_dir) - mirror_size
+
+RESOLUTION_FILES = ("pubspec.lock", ".dart_tool/package_config.json", ".dart_tool/package_graph.json")
+
+# content address of a `dart pub get` attempt: normalized pubspec incl. overrides, pubspecs of path dependencies, the SDK
+# and the committed pubspec.lock, which pins the versions that pub get resolves
+def resolution_key(pubspec: dict, app_path: str, flutter_dir: str, lockfile: str = None):
+    path_pubspecs = []
+    for section in ("dependencies", "dev_dependencies", "dependency_overrides"):
+        for name, dependency in sorted((pubspec.get(section) or {}).items()):
+            if isinstance(dependency, dict) and "path" in dependency:
+                try:
+                    with open(f"{app_path}/{dependency['path']}/pubspec.yaml") as f:
+                        path_pubspecs.append(f.read())
+                except OSError:
+                    path_pubspecs.append(None)
+    normalized = json.dumps([pubspec, path_pubspecs, flutter_dir, lockfile], sort_keys=True, default=str)
+    return hashlib.sha256(normalized.encode()).hexdigest()
 
+def save_resolution(resolutions_dir: str, key: str, app_path: str):
+    tmp_dir = tempfile.mkdtemp(prefix=f"{key}.", dir=resolutions_dir)
+    for name in RESOLUTION_FILES:
+        if isfile(f"{app_path}/{name}"):
+            os.makedirs(dirname(f"{tmp_dir}/{name}"), exist_ok=True)
+            shutil.copyfile(f"{app_path}/{name}", f"{tmp_dir}/{name}")
+    try:
+        os.rename(tmp_dir, f"{resolutions_dir}/{key}")
+    except OSError: # saved concurrently by another worker
+        shutil.rmtree(tmp_dir)
+
+def restore_resolution(resolutions_dir: str, key: str, app_path: str):
+    resolution_dir = f"{resolutions_dir}/{key}"
+    try:
+        with open(f"{resolution_dir}/.dart_tool/package_config.json") as f:
+            package_config = json.load(f)
+    except OSError:
+        return False
+    # packages might have been removed from the pub cache since
+    for package in package_config["packages"]:
+        if package["rootUri"].startswith("file://") and not isdir(package["rootUri"].removeprefix("file://")):
+            return False
+    for name in RESOLUTION_FILES:
+        if isfile(f"{resolution_dir}/{name}"):
+            os.makedirs(dirname(f"{app_path}/{name}"), exist_ok=True)
+            shutil.copyfile(f"{resolution_dir}/{name}", f"{app_path}/{name}")
+    return True
+
+# only needed once for clones that older versions set up in place, marked afterwards so later runs skip it
+def clean_repo(repo_dir: str):
+    run_child(["git", "-C", repo_dir, "reset", "--hard"])
+    run_child(["git", "-C", repo_dir, "clean", "-fxd"])
+    open(f"{repo_dir}/.git/pristine", "w").close()
+
+# files that setup_analyzer, restore_resolution and dart pub get write in place, pub workspaces write them in a parent dir
+WORKSPACE_WRITTEN = ("pubspec.yaml", "pubspec.lock", "analysis_options.yaml", ".dart_tool")
+# None until the first copy found out whether the file system supports reflinks
+REFLINK = None
+
+def unshare(path: str):
+    # replaces a hardlink with a copy of its own, so writing to it doesn't change the clone
+    if isdir(path) and not os.path.islink(path):
+        for name in os.listdir(path):
+            unshare(f"{path}/{name}")
+    elif isfile(path) and not os.path.islink(path) and os.stat(path).st_nlink > 1:
+        shutil.copy2(path, f"{path}.unshare")
+        os.replace(f"{path}.unshare", path)
+
+# throwaway copy of the clone for one analysis run: reflinks share blocks until written (btrfs, xfs),
+# otherwise files are hardlinked and the ones written during setup are unshared. the clone itself is never written to
+def create_workspace(repo_dir: str, workspaces_dir: str, app: sqlite3.Row):
+    global REFLINK
+    os.makedirs(workspaces_dir, exist_ok=True)
+    workspace_dir = tempfile.mkdtemp(prefix=f"{app['id']}.", dir=workspaces_dir) + "/repo"
+    try:
+        if REFLINK is not False:
+            try:
+                run_child(["cp", "-a", "--reflink=always", repo_dir, workspace_dir], capture_stderr=True)
+                REFLINK = True
+            except CalledProcessError:
+                REFLINK = False
+                shutil.rmtree(workspace_dir, ignore_errors=True)
+        if not REFLINK:
+            run_child(["cp", "-al", repo_dir, workspace_dir])
+            directory = f"{workspace_dir}/{app['path']}".rstrip("/")
+            while True:
+                for name in WORKSPACE_WRITTEN:
+                    unshare(f"{directory}/{name}")
+                if directory == workspace_dir:
+                    break
+                directory = dirname(directory)
+        shutil.rmtree(f"{workspace_dir}/.git")
+    except BaseException:
+        remove_workspace(workspace_dir)
+        raise
+    return workspace_dir
+
+def remove_workspace(workspace_dir: str):
+    shutil.rmtree(dirname(workspace_dir), ignore_errors=True)
+
+# returns the SDK and override combination that resolved
+def setup_analyzer(app: sqlite3.Row, repo_dir: str, flutter_3_7_12: str, flutter_3_27_0: str, lint_rules: list[str], resolutions_dir: str):
     app_path = f"{repo_dir}/{app['path']}"
     pubspec_path = f"{repo_dir}/{app['pubspec_path']}"
     with open(pubspec_path) as f:
@@ -50,15 +252,19 @@ def setup_analyzer(app: sqlite3.Row, repo_dir: str, flutter_3_7_12: str, flutter
             analysis_options["custom_lint"] = {"enable_all_lint_rules": False, "rules": lint_rules}
         yaml.safe_dump(analysis_options, f)
 
+    os.makedirs(resolutions_dir, exist_ok=True)
+    # read before the first attempt, restore_resolution and pub get replace it
+    lockfile = None
+    if isfile(f"{app_path}/pubspec.lock"):
+        with open(f"{app_path}/pubspec.lock") as f:
+            lockfile = f.read()
     stderr_output = ""
     for (use_old_flutter, override_deps) in product((False, True), repeat=2):
         try:
             env = os.environ.copy()
             pubspec_copy = deepcopy(pubspec)
-            if use_old_flutter:
-                env["PATH"] = f"{flutter_3_7_12}:{os.environ['PATH']}"
-            else:
-                env["PATH"] = f"{flutter_3_27_0}:{os.environ['PATH']}"
+            flutter_dir = flutter_3_7_12 if use_old_flutter else flutter_3_27_0
+            env["PATH"] = f"{flutter_dir}:{os.environ['PATH']}"
             if override_deps:
                 if use_old_flutter:
                     added_overrides = {
@@ -80,24 +286,167 @@ def setup_analyzer(app: sqlite3.Row, repo_dir: str, flutter_3_7_12: str, flutter
                 dependency_overrides = pubspec.get("dependency_overrides", {}) or {}
                 dependency_overrides.update(added_overrides)
                 pubspec_copy["dependency_overrides"] = dependency_overrides
+            key = resolution_key(pubspec_copy, app_path, flutter_dir, lockfile)
+            if isfile(f"{resolutions_dir}/{key}.failed"):
+                with open(f"{resolutions_dir}/{key}.failed") as f:
+                    stderr_output += f.read()
+                continue
             with open(pubspec_path, "w") as f:
                 yaml.safe_dump(pubspec_copy, f)
-            run(["dart", "pub", f"--directory={app_path}", "get"], stdout=PIPE, stderr=PIPE, env=env, check=True, encoding='utf-8')
-            return
+            combination = f"flutter {'3.7.12' if use_old_flutter else '3.27.0'}{' with overrides' if override_deps else ''}"
+            if restore_resolution(resolutions_dir, key, app_path):
+                return f"{combination} (cached)"
+            run_child(["dart", "pub", f"--directory={app_path}", "get"], capture_stderr=True, env=env)
+            save_resolution(resolutions_dir, key, app_path)
+            return combination
         except CalledProcessError as e:
             stderr_output += e.stderr
+            # only remember deterministic failures, not network errors
+            if "version solving failed" in e.stderr.lower():
+                with open(f"{resolutions_dir}/{key}.failed", "w") as f:
+                    f.write(e.stderr)
     raise Exception(stderr_output)
             
 
-def run_analyzer(app: sqlite3.Row, shell_dir: str, repo_dir: str, flutter_dir: str):
+# yields the entries of the "diagnostics" array of `custom_lint --format=json` while the output is still being read
+def iter_diagnostics(stream, chunk_size: int = 1 << 16):
+    decoder = json.JSONDecoder()
+    buffer, position = "", 0
+    def read():
+        nonlocal buffer, position
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise ValueError(f"unexpected end of custom_lint output: {buffer[position:position + 200]!r}")
+        buffer, position = buffer[position:] + chunk, 0
+    # anything before the array (e.g. "Building package executable..." of dart run) is skipped
+    while (start := buffer.find('"diagnostics"')) == -1 or buffer.find("[", start) == -1:
+        read()
+    position = buffer.find("[", start) + 1
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position == len(buffer):
+            read()
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            diagnostic, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # a diagnostic cut off at the end of the buffer
+            read()
+            continue
+        yield diagnostic
+
+def run_analyzer(app: sqlite3.Row, shell_dir: str, repo_dir: str, flutter_dir: str, lint_rules: set[str]):
     app_path = f"{repo_dir}/{app['path']}"
-    os.chdir(shell_dir)
     env = os.environ.copy()
     env["PATH"] = f"{flutter_dir}:{os.environ['PATH']}"
 
-    output = run(["dart", "run", "custom_lint", "--format=json", f"--directory={app_path}"], stdout=PIPE, env=env).stdout
-    output_dict = json.loads(output)
-    return output_dict["diagnostics"]
+    # cwd instead of os.chdir, so that concurrent workers don't change each other's working directory
+    # stderr goes to a file, a pipe could fill up while stdout is read
+    with tempfile.TemporaryFile("w+") as stderr:
+        process = Popen(["dart", "run", "custom_lint", "--format=json", f"--directory={app_path}"], stdout=PIPE, stderr=stderr, env=env, cwd=shell_dir, encoding="utf-8")
+        try:
+            findings = [compact_finding(diagnostic) for diagnostic in iter_diagnostics(process.stdout) if diagnostic["code"] in lint_rules]
+        except (ValueError, KeyError) as e:
+            process.kill()
+            wait_child(process)
+            stderr.seek(0)
+            raise Exception(f"custom_lint exited with status {process.returncode}: {e}\n{stderr.read()[-2000:]}") from None
+        finally:
+            process.stdout.close()
+        # custom_lint exits with 1 when it reports warnings, the output is complete nonetheless
+        wait_child(process)
+    return findings
+
+# seconds a lint daemon may take for one app before it is killed and restarted
+LINT_DAEMON_TIMEOUT = 600
+
+class LintDaemon:
+    # long-lived `thesis_lints:lint_daemon` process in the shell dir, analyzes one app directory per request
+    def __init__(self, shell_dir: str, flutter_dir: str):
+        self.shell_dir = shell_dir
+        self.flutter_dir = flutter_dir
+        env = os.environ.copy()
+        env["PATH"] = f"{flutter_dir}:{os.environ['PATH']}"
+        self.process = Popen(["dart", "run", "thesis_lints:lint_daemon"], stdin=PIPE, stdout=PIPE, env=env, cwd=shell_dir, encoding="utf-8")
+        if "ready" not in self.read():
+            raise Exception("lint daemon did not report ready")
+
+    # next JSON object on stdout, `dart run` prints build progress there as well
+    def read(self) -> dict:
+        while line := self.process.stdout.readline():
+            try:
+                output_dict = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(output_dict, dict):
+                return output_dict
+        raise Exception(f"lint daemon exited with status {self.process.wait()}")
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    # a daemon that crashed or was killed after a timeout is replaced by a new one
+    def restart(self) -> "LintDaemon":
+        self.close()
+        return LintDaemon(self.shell_dir, self.flutter_dir)
+
+    def analyze(self, app_path: str, lint_rules: list[str], timeout: float = LINT_DAEMON_TIMEOUT) -> list[dict]:
+        # killing the process ends the blocking read, the dead daemon is restarted before its next app
+        timed_out = threading.Event()
+        def kill():
+            timed_out.set()
+            self.process.kill()
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            self.process.stdin.write(json.dumps({"directory": app_path, "rules": lint_rules}) + "\n")
+            self.process.stdin.flush()
+            output_dict = self.read()
+        except Exception as e:
+            if timed_out.is_set():
+                raise Exception(f"lint daemon timed out after {timeout}s") from None
+            if isinstance(e, BrokenPipeError):
+                raise Exception(f"lint daemon exited with status {self.process.wait()}") from None
+            raise
+        finally:
+            timer.cancel()
+        if "error" in output_dict:
+            raise Exception(output_dict["error"])
+        return output_dict["diagnostics"]
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self.process.wait(timeout=60)
+        except TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+# builds the daemon executable once, daemons started at the same time would race on .dart_tool in the shell dir
+def build_lint_daemon(shell_dir: str, flutter_dir: str):
+    env = os.environ.copy()
+    env["PATH"] = f"{flutter_dir}:{os.environ['PATH']}"
+    # exits after the ready line when stdin is closed
+    check_output(["dart", "run", "thesis_lints:lint_daemon"], stdin=DEVNULL, env=env, cwd=shell_dir)
+
+def run_analyzer_daemon(app: sqlite3.Row, daemons: Queue, repo_dir: str, lint_rules: set[str]):
+    app_path = f"{repo_dir}/{app['path']}"
+    daemon = daemons.get()
+    try:
+        if not daemon.alive():
+            daemon = daemon.restart()
+        diagnostics = daemon.analyze(app_path, sorted(lint_rules))
+    finally:
+        # a daemon that failed to restart is put back as well, the next app tries again
+        daemons.put(daemon)
+    return [compact_finding(diagnostic) for diagnostic in diagnostics if diagnostic["code"] in lint_rules]
 
 def prepare_custom_lint_shell_dir(thesis_lints_dir: str, flutter_dir: str):
     env = os.environ.copy()
@@ -128,9 +477,291 @@ dependency_overrides:
       ref: feat_workspace
 """)
     check_output(["dart", "pub", f"--directory={shell_dir}", "get"], env=env)
+    # builds the custom_lint executable once, concurrent first `dart run custom_lint` of the jobs would race on .dart_tool
+    check_output(["dart", "run", "custom_lint", "--help"], env=env, cwd=shell_dir)
     return shell_dir
 
-def download_analyze_apps(connection: sqlite3.Connection, config: dict, args):
+# fingerprint of every lint rule: its line in the `lints` list plus everything shared by all rules (lib/src, rest of thesis_lints.dart, dependencies,
+# the lint daemon that runs them with --daemon)
+def lint_rule_fingerprints(thesis_lints_dir: str, shell_dir: str, flutter_dir: str, daemon: bool = False) -> dict[str, str]:
+    env = os.environ.copy()
+    env["PATH"] = f"{flutter_dir}:{os.environ['PATH']}"
+    output = check_output(["dart", "run", "thesis_lints"], env=env, cwd=shell_dir, encoding="utf-8")
+    lint_names = json.loads(output.splitlines()[-1])
+
+    shared = hashlib.sha256()
+    paths = ["pubspec.yaml", "pubspec.lock"] + sorted(f"lib/src/{name}" for name in os.listdir(f"{thesis_lints_dir}/lib/src"))
+    if daemon:
+        paths.append("bin/lint_daemon.dart")
+    # the lockfile of the shell dir pins custom_lint and custom_lint_builder, which come from git overrides resolved there
+    for path in [f"{thesis_lints_dir}/{path}" for path in paths] + [f"{shell_dir}/pubspec.lock"]:
+        with open(path, "rb") as f:
+            shared.update(f.read())
+    with open(f"{thesis_lints_dir}/lib/thesis_lints.dart") as f:
+        source = f.read()
+    head, _, rest = source.partition("final lints = [")
+    body, _, tail = rest.partition("];")
+    shared.update((head + tail).encode())
+    entries = [line.strip() for line in body.splitlines() if line.strip() and not line.strip().startswith("//")]
+    if len(entries) != len(lint_names): # lints not declared one per line, fall back to the whole list for every rule
+        entries = [body] * len(lint_names)
+    return {name: hashlib.sha256(shared.digest() + entry.encode()).hexdigest() for name, entry in zip(lint_names, entries)}
+
+# fingerprint of one rule's findings of an app, changes with the analyzed commit or the rule
+def analysis_fingerprint(commit_sha: str, rule_fingerprint: str) -> str:
+    return hashlib.sha256(f"{commit_sha}:{rule_fingerprint}".encode()).hexdigest()
+
+# clone, setup and analyze a single app in its own repo_dir, returns (commit_sha, findings, error, fingerprints of the analyzed rules, trace)
+def analyze_app(app: sqlite3.Row, config: dict, args, shell_dir: str, rule_fingerprints: dict[str, str], app_fingerprints: dict[str, str], daemons: Queue = None):
+    repo_dir = f"{config['repos_dir']}/{app['id']}"
+    commit_sha = None
+    trace = ScanTrace()
+    if args.force_clone or not isfile(f"{repo_dir}/{app['pubspec_path']}"):
+        try:
+            with trace.stage("clone") as stage:
+                commit_sha, stage.bytes = clone_repo(app, repo_dir, f"{config['repos_dir']}/.mirrors", app["commit_sha"])
+        except Exception as e:
+            return None, None, f"Failed to clone {app['github_repo']}: {e}", None, trace
+    # only rerun rules whose fingerprint changed since the last analysis of this app
+    fingerprints = {rule: analysis_fingerprint(commit_sha or app["commit_sha"], rule_fingerprint) for rule, rule_fingerprint in rule_fingerprints.items()}
+    stale_rules = [rule for rule, fingerprint in fingerprints.items() if args.force_analyze or app_fingerprints.get(rule) != fingerprint]
+    if not stale_rules:
+        return commit_sha, None, None, None, trace
+    fingerprints = {rule: fingerprints[rule] for rule in stale_rules}
+    lint_rules = stale_rules if len(stale_rules) < len(rule_fingerprints) or args.rules else None
+    try:
+        if commit_sha or not isfile(f"{repo_dir}/.git/pristine"):
+            with trace.stage("clean"):
+                clean_repo(repo_dir)
+        with trace.stage("workspace"):
+            workspace_dir = create_workspace(repo_dir, f"{config['repos_dir']}/.workspaces", app)
+    except Exception as e:
+        return commit_sha, None, f"failed to setup app: {app['id']} {app['github_repo']}: {e}", None, trace
+    try:
+        try:
+            with trace.stage("pub_get") as stage:
+                stage.detail = setup_analyzer(app, workspace_dir, config['flutter_3_7_12'], config['flutter_3_27_0'], lint_rules, f"{config['repos_dir']}/.resolutions")
+        except Exception as e:
+            return commit_sha, None, f"failed to setup app: {app['id']} {app['github_repo']}: {e}", None, trace
+        # custom_lint reports codes in lowercase
+        rule_set = {rule.lower() for rule in stale_rules}
+        try:
+            with trace.stage("analyze") as stage:
+                if daemons:
+                    stage.detail = "daemon"
+                    findings = run_analyzer_daemon(app, daemons, workspace_dir, rule_set)
+                else:
+                    findings = run_analyzer(app, shell_dir, workspace_dir, config['flutter_3_27_0'], rule_set)
+                stage.findings = len(findings)
+            # paths as if the clone had been analyzed, the workspace is gone afterwards and differs between runs
+            findings = [(code, message, repo_dir + path.removeprefix(workspace_dir) if path.startswith(f"{workspace_dir}/") else path, *location) for code, message, path, *location in findings]
+        except Exception as e:
+            return commit_sha, None, f"Failed to analyze app {app['id']} {app['github_repo']}: {e}", None, trace
+    finally:
+        remove_workspace(workspace_dir)
+    return commit_sha, findings, None, fingerprints, trace
+
+# autocommit=True turns `with connection:` into a no-op, so transactions are started explicitly
+@contextmanager
+def transaction(connection: sqlite3.Connection, immediate: bool = False):
+    connection.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+def load_lint_rule_ids(connection: sqlite3.Connection):
+    return {row["name"].lower(): row["id"] for row in connection.execute("SELECT id, name FROM lint_rule")}
+
+# offset, length, line, column, end_line, end_column of a custom_lint location
+def location_columns(location: dict):
+    start, end = location["range"]["start"], location["range"]["end"]
+    return start["offset"], end["offset"] - start["offset"], start["line"], start["column"], end["line"], end["column"]
+
+# the parts of a diagnostic that are stored: code, message, file and location_columns
+def compact_finding(diagnostic: dict):
+    location = diagnostic["location"]
+    return diagnostic["code"], diagnostic["problemMessage"], location["file"], *location_columns(location)
+
+def save_finding_files(connection: sqlite3.Connection, app_id: int, paths: set[str]):
+    connection.executemany("INSERT OR IGNORE INTO finding_file (app, path) VALUES (?, ?)", [(app_id, path) for path in paths])
+    return {row["path"]: row["id"] for row in connection.execute("SELECT id, path FROM finding_file WHERE app = ?", (app_id,))}
+
+# databases from before finding_file store the location as indented JSON text, the finding table is rebuilt with the compact columns
+def migrate_finding_locations(connection: sqlite3.Connection, create_db_script: str):
+    if "location" not in [row["name"] for row in connection.execute("PRAGMA table_info(finding)")]:
+        return
+    with transaction(connection):
+        connection.execute("ALTER TABLE finding RENAME TO finding_location_text")
+        for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'finding_location_text' AND sql IS NOT NULL").fetchall():
+            connection.execute(f'DROP INDEX "{row["name"]}"')
+        connection.executescript(create_db_script)
+        rows = connection.execute("SELECT * FROM finding_location_text ORDER BY app").fetchall()
+        # manually added findings may have free text locations, they are kept as file path without range
+        columns = {}
+        paths = {}
+        for row in rows:
+            if not row["location"]:
+                continue
+            try:
+                location = json.loads(row["location"])
+                columns[row["id"]] = (location["file"], *location_columns(location))
+            except (json.JSONDecodeError, TypeError, KeyError):
+                columns[row["id"]] = (row["location"], *(None,) * 6)
+            paths.setdefault(row["app"], set()).add(columns[row["id"]][0])
+        file_ids = {app_id: save_finding_files(connection, app_id, app_paths) for app_id, app_paths in paths.items()}
+        findings = []
+        for row in rows:
+            path, *location = columns.get(row["id"], (None,) * 7)
+            findings.append((row["id"], row["vulnerable"], row["description"], file_ids[row["app"]][path] if path else None, *location, row["app"], row["lint_rule"]))
+        connection.executemany(
+            'INSERT INTO finding (id, vulnerable, description, file, "offset", "length", line, "column", end_line, end_column, app, lint_rule) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            findings
+        )
+        connection.execute("DROP TABLE finding_location_text")
+    connection.execute("VACUUM")
+
+# findings are compact_finding tuples, already filtered to the rules in fingerprints
+def save_findings(connection: sqlite3.Connection, app: sqlite3.Row, findings: list[tuple], fingerprints: dict[str, str], lint_rule_ids: dict[str, int]):
+    lint_rules = {rule.lower() for rule in fingerprints}
+    # the new findings replace the old, unconfirmed findings of the reanalyzed rules that are not manually added (lint_rule IS NULL for manual findings),
+    # a rule rerun for a stale fingerprint would otherwise report its findings twice
+    rule_ids = [lint_rule_ids[rule] for rule in lint_rules if rule in lint_rule_ids]
+    connection.execute(
+        f"DELETE FROM finding WHERE app = ? AND vulnerable IS NULL AND lint_rule IN ({','.join('?' * len(rule_ids))})",
+        (app["id"], *rule_ids)
+    )
+
+    file_ids = save_finding_files(connection, app["id"], {path for _, _, path, *_ in findings})
+    connection.executemany(
+        'INSERT INTO finding (description, file, "offset", "length", line, "column", end_line, end_column, app, lint_rule) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        ((message, file_ids[path], *location, app["id"], lint_rule_ids.get(code)) for code, message, path, *location in findings)
+    )
+    connection.executemany("REPLACE INTO analysis_fingerprint (app, lint_rule, fingerprint) VALUES (?, ?, ?)", [(app["id"], rule, fingerprint) for rule, fingerprint in fingerprints.items()])
+    connection.execute("UPDATE app SET analyzed = TRUE WHERE id = ?", (app["id"],))
+
+SUMMARY_TABLES = ("app_rule_summary", "app_risk_summary", "app_category_summary")
+
+# recomputes the summaries of one app from its findings, or of all apps
+def refresh_summaries(connection: sqlite3.Connection, app_id: int = None):
+    app_filter, params = ("AND app = ?", (app_id,)) if app_id is not None else ("", ())
+    for table in SUMMARY_TABLES:
+        connection.execute(f"DELETE FROM {table} WHERE TRUE {app_filter}", params)
+    connection.execute(f"""
+        INSERT INTO app_rule_summary (app, lint_rule, findings, vulnerable)
+        SELECT app, lint_rule, count(*), sum(vulnerable IS 1) FROM finding
+        WHERE lint_rule IS NOT NULL {app_filter} GROUP BY app, lint_rule
+        """,
+        params
+    )
+    # a rule can belong to several apis, every risk and category is counted once per rule
+    connection.execute(f"""
+        INSERT INTO app_risk_summary (app, risk, findings, vulnerable)
+        SELECT app, risk, sum(findings), sum(vulnerable) FROM app_rule_summary
+        JOIN (SELECT DISTINCT lint_rule, risk FROM api WHERE risk IS NOT NULL) USING (lint_rule)
+        WHERE TRUE {app_filter} GROUP BY app, risk
+        """,
+        params
+    )
+    connection.execute(f"""
+        INSERT INTO app_category_summary (app, masvs_category, findings, vulnerable)
+        SELECT app, masvs_category, sum(findings), sum(vulnerable) FROM app_rule_summary
+        JOIN (SELECT DISTINCT lint_rule, masvs_category FROM api JOIN common_risk ON api.risk = common_risk.id) USING (lint_rule)
+        WHERE TRUE {app_filter} GROUP BY app, masvs_category
+        """,
+        params
+    )
+
+def save_trace(connection: sqlite3.Connection, run_id: int, app: sqlite3.Row, trace: ScanTrace):
+    connection.executemany(
+        "INSERT INTO scan_stage (run, app, stage, started_at, duration, cpu_user, cpu_system, max_rss, bytes, detail, findings, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(run_id, app["id"], stage.stage, stage.started_at, stage.duration, stage.cpu_user, stage.cpu_system, stage.max_rss, stage.bytes, stage.detail, stage.findings, stage.error) for stage in trace.stages]
+    )
+
+# apps that crashed this many workers are left alone
+MAX_LEASE_ATTEMPTS = 3
+
+class WorkQueue:
+    # work_lease table in a database shared by all workers, e.g. the main database in a directory all hosts mount.
+    # rollback journal instead of WAL: the WAL index is shared memory, which processes on different hosts don't share, BEGIN IMMEDIATE locks the file itself
+    def __init__(self, path: str, create_db_script: str, lease: float):
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.renewed_at = time()
+        # leaving WAL needs the database to itself: every open connection keeps it in use, so each attempt uses its own short-lived one,
+        # and workers starting at the same time back off at random until one has switched it
+        deadline = time() + 60
+        while True:
+            switch = sqlite3.connect(path, autocommit=True, timeout=1)
+            try:
+                journal_mode = switch.execute("PRAGMA journal_mode = DELETE").fetchone()[0]
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                journal_mode = "locked"
+            finally:
+                switch.close()
+            if journal_mode == "delete":
+                break
+            if time() > deadline:
+                raise RuntimeError(f"queue database {path} stays in {journal_mode} mode while other connections have it open")
+            sleep(random.uniform(0.05, 0.5))
+        self.connection = sqlite3.connect(path, autocommit=True, timeout=60)
+        self.connection.executescript(create_db_script)
+
+    # every worker adds its selection, apps that are already queued keep their state
+    def add(self, apps: list[sqlite3.Row]):
+        with transaction(self.connection, immediate=True):
+            self.connection.executemany("INSERT OR IGNORE INTO work_lease (app, priority) VALUES (?, ?)", [(app["id"], app["github_stars"]) for app in apps])
+
+    def pending(self):
+        return self.connection.execute("SELECT count(*) FROM work_lease WHERE finished_at IS NULL AND attempts < ?", (MAX_LEASE_ATTEMPTS,)).fetchone()[0]
+
+    # the app with the highest priority that is neither finished nor leased, None when there is none
+    def claim(self):
+        now = time()
+        with transaction(self.connection, immediate=True):
+            row = self.connection.execute(
+                "SELECT app FROM work_lease WHERE finished_at IS NULL AND (expires_at IS NULL OR expires_at < ?) AND attempts < ? ORDER BY priority DESC, app LIMIT 1",
+                (now, MAX_LEASE_ATTEMPTS)
+            ).fetchone()
+            if row:
+                self.connection.execute("UPDATE work_lease SET owner = ?, expires_at = ?, attempts = attempts + 1 WHERE app = ?", (self.owner, now + self.lease, row[0]))
+        return row[0] if row else None
+
+    # unfinished apps of other workers that may still expire and be claimed again
+    def leased(self):
+        return self.connection.execute(
+            "SELECT count(*) FROM work_lease WHERE finished_at IS NULL AND (attempts < ? OR expires_at > ?)", (MAX_LEASE_ATTEMPTS, time())
+        ).fetchone()[0]
+
+    # heartbeat for all apps of this worker, leases that already expired and were claimed by another worker stay lost
+    def renew(self):
+        if time() - self.renewed_at < self.lease / 3:
+            return
+        self.renewed_at = time()
+        self.connection.execute("UPDATE work_lease SET expires_at = ? WHERE owner = ? AND finished_at IS NULL", (self.renewed_at + self.lease, self.owner))
+
+    # called once the results are committed, an app analyzed twice after a lost lease is deduplicated by merge_database
+    def finish(self, app_id: int, error: str):
+        self.connection.execute("UPDATE work_lease SET owner = ?, finished_at = ?, error = ? WHERE app = ?", (self.owner, time(), error, app_id))
+
+    def close(self):
+        self.connection.close()
+
+# --shard i/N, apps are split by id so that the shards of all hosts are disjoint
+def shard(value: str):
+    try:
+        index, count = map(int, value.split("/"))
+    except ValueError:
+        raise ArgumentTypeError(f"expected i/N, got {value}")
+    if not 0 <= index < count:
+        raise ArgumentTypeError(f"shard index {index} not in 0..{count - 1}")
+    return index, count
+
+def download_analyze_apps(connection: sqlite3.Connection, config: dict, args, queue: WorkQueue = None):
     lint_rules = None # == use all lint_rules
     if args.rules:
         rule_tuple = tuple(map(int, args.rules.split(',')))
@@ -139,52 +770,266 @@ def download_analyze_apps(connection: sqlite3.Connection, config: dict, args):
 
     cursor = connection.execute("SELECT * FROM app ORDER BY github_stars DESC LIMIT ?", (args.limit,))
     apps: list[sqlite3.Row] = cursor.fetchall()
+    if args.shard:
+        index, count = args.shard
+        apps = [app for app in apps if app["id"] % count == index]
+    if queue:
+        queue.add(apps)
     shell_dir = prepare_custom_lint_shell_dir(config["thesis_lints_dir"], config["flutter_3_27_0"])
-    for app in tqdm(apps):
-        repo_dir = f"{config['repos_dir']}/{app['id']}"
-        if args.force_clone or not isfile(f"{repo_dir}/{app['pubspec_path']}"):
-            try:
-                commit_sha = clone_repo(app, repo_dir, app["commit_sha"])
-                connection.execute("UPDATE app SET commit_sha = ? WHERE id = ?", (commit_sha, app["id"]))
-            except Exception as e:
-                print(f"Failed to clone {app['github_repo']}: {e}")
-                continue
-        if args.force_analyze or not app["analyzed"]:
-            try:
-                setup_analyzer(app, repo_dir, config['flutter_3_7_12'], config['flutter_3_27_0'], lint_rules)
-            except Exception as e:
-                print(f"failed to setup app: {app['id']} {app['github_repo']}: {e}")
-                continue
-            try:
-                findings = run_analyzer(app, shell_dir, repo_dir, config['flutter_3_27_0'])
-            except Exception as e:
-                print(f"Failed to analyze app {app['id']} {app['github_repo']}: {e}")
-                continue
+    rule_fingerprints = lint_rule_fingerprints(config["thesis_lints_dir"], shell_dir, config["flutter_3_27_0"], args.daemon)
+    # apps analyzed before fingerprints were recorded count as analyzed with the current rules, like the analyzed flag did, instead of all being rerun
+    with transaction(connection):
+        connection.executemany(
+            "INSERT INTO analysis_fingerprint (app, lint_rule, fingerprint) VALUES (?, ?, ?)",
+            [
+                (app["id"], rule, analysis_fingerprint(app["commit_sha"], rule_fingerprint))
+                for app in connection.execute("SELECT id, commit_sha FROM app WHERE analyzed AND commit_sha IS NOT NULL AND id NOT IN (SELECT app FROM analysis_fingerprint)").fetchall()
+                for rule, rule_fingerprint in rule_fingerprints.items()
+            ]
+        )
+    if lint_rules is not None:
+        selected_rules = set(map(str.lower, lint_rules))
+        rule_fingerprints = {rule: fingerprint for rule, fingerprint in rule_fingerprints.items() if rule.lower() in selected_rules}
+    # the queue may hand out apps of other workers' selections
+    app_fingerprints = {}
+    for row in connection.execute("SELECT app, lint_rule, fingerprint FROM analysis_fingerprint"):
+        app_fingerprints.setdefault(row["app"], {})[row["lint_rule"]] = row["fingerprint"]
+    daemons = None
+    if args.daemon:
+        daemons = Queue()
+        build_lint_daemon(shell_dir, config["flutter_3_27_0"])
+        for _ in range(args.jobs):
+            daemons.put(LintDaemon(shell_dir, config["flutter_3_27_0"]))
+    lint_rule_ids = load_lint_rule_ids(connection)
+    run_id = connection.execute("INSERT INTO scan_run (started_at, jobs, args) VALUES (?, ?, ?)", (time(), args.jobs, json.dumps(vars(args)))).lastrowid
+    pending = iter(apps)
+    # the next app of the selection, or the next one claimed from the queue
+    def next_app():
+        if not queue:
+            return next(pending, None)
+        app_id = queue.claim()
+        return app_id and connection.execute("SELECT * FROM app WHERE id = ?", (app_id,)).fetchone()
 
-            # clean up old, unconfirmed findings that are not manually added (lint_rule IS NULL for manual findings)
-            if args.delete_findings:
-                connection.execute("DELETE FROM finding WHERE app = ? AND vulnerable IS NULL AND lint_rule IS NOT NULL", (app["id"],))
-            
-            connection.executemany("""
-                INSERT INTO finding (description, location, app, lint_rule) VALUES (
-                    ?, ?, ?,
-                    (SELECT id FROM lint_rule WHERE lint_rule.name = ? COLLATE NOCASE)
-                )
-                """,
-                [(finding["problemMessage"], json.dumps(finding["location"], indent=4), app["id"], finding["code"]) for finding in findings if lint_rules is None or finding["code"] in map(str.lower, lint_rules)]
-            )
-            connection.execute("UPDATE app SET analyzed = TRUE WHERE id = ?", (app["id"],))
+    # workers only run subprocesses in their own repo_dir, this thread is the only one writing to the database and renews the leases
+    progress = tqdm(total=queue.pending() if queue else len(apps))
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {}
+        while True:
+            while len(futures) < args.jobs and (app := next_app()):
+                futures[executor.submit(analyze_app, app, config, args, shell_dir, rule_fingerprints, app_fingerprints.get(app["id"], {}), daemons)] = app
+            if not futures:
+                # apps leased by other workers are claimed again if their worker dies before they are finished
+                if queue and queue.leased():
+                    sleep(1)
+                    continue
+                break
+            done, _ = wait(futures, timeout=queue.lease / 3 if queue else None, return_when=FIRST_COMPLETED)
+            if queue:
+                queue.renew()
+            for future in done:
+                app = futures.pop(future)
+                commit_sha, findings, error, fingerprints, trace = future.result()
+                # one transaction per app instead of one per statement
+                with transaction(connection):
+                    if commit_sha:
+                        connection.execute("UPDATE app SET commit_sha = ? WHERE id = ?", (commit_sha, app["id"]))
+                    if not error and findings is not None:
+                        with trace.stage("write") as stage:
+                            save_findings(connection, app, findings, fingerprints, lint_rule_ids)
+                            refresh_summaries(connection, app["id"])
+                            stage.findings = len(findings)
+                    save_trace(connection, run_id, app, trace)
+                if error:
+                    print(error)
+                if queue:
+                    queue.finish(app["id"], error)
+                progress.update()
+    progress.close()
+    if daemons:
+        while not daemons.empty():
+            daemons.get().close()
     shutil.rmtree(shell_dir)
+    connection.execute("UPDATE scan_run SET finished_at = ? WHERE id = ?", (time(), run_id))
+
+# what identifies a finding across databases, whose ids differ
+FINDING_KEY = 'lower(lint_rule.name), finding_file.path, finding."offset", finding."length", finding.line, finding."column", finding.end_line, finding.end_column, finding.description'
+
+def finding_keys(connection: sqlite3.Connection, schema: str, app_id: int, rules: set[str]):
+    rows = connection.execute(f"""
+        SELECT finding.id, finding.vulnerable, {FINDING_KEY}
+        FROM {schema}.finding JOIN {schema}.lint_rule ON finding.lint_rule = lint_rule.id LEFT JOIN {schema}.finding_file ON finding.file = finding_file.id
+        WHERE finding.app = ? AND lower(lint_rule.name) IN ({','.join('?' * len(rules))})
+        """,
+        (app_id, *rules)
+    )
+    return [(row[0], row[1], tuple(row)[2:]) for row in rows]
+
+# folds the results of a worker database (--output) into this one, apps are matched by github_repo and lint rules by name.
+# for every rule of an app the shard wrote in a run not merged yet that changed its fingerprint or was forced, its findings replace the unconfirmed ones of this database and
+# findings that are already here are not inserted again, so merging a shard twice or an app analyzed by two workers adds nothing
+def merge_database(connection: sqlite3.Connection, path: str):
+    connection.execute("ATTACH DATABASE ? AS shard", (realpath(path, strict=True),))
+    try:
+        with transaction(connection):
+            app_ids = dict(connection.execute("SELECT shard_app.id, main.app.id FROM shard.app AS shard_app JOIN main.app USING (github_repo)").fetchall())
+            lint_rule_ids = load_lint_rule_ids(connection)
+            fingerprints = {"main": {}, "shard": {}}
+            for schema, schema_fingerprints in fingerprints.items():
+                for row in connection.execute(f"SELECT app, lint_rule, fingerprint FROM {schema}.analysis_fingerprint"):
+                    schema_fingerprints.setdefault(row["app"], {})[row["lint_rule"]] = row["fingerprint"]
+            # scan runs are identified by their start time and arguments
+            runs = connection.execute("""
+                SELECT * FROM shard.scan_run AS shard_run
+                WHERE NOT EXISTS (SELECT 1 FROM main.scan_run WHERE started_at = shard_run.started_at AND args IS shard_run.args)
+                """).fetchall()
+
+            # only apps the shard wrote in a run not merged yet: the rest of the shard is the copy of this database it started from,
+            # which is older than what other shards merged in the meantime
+            changed = {}
+            for run in runs:
+                run_args = json.loads(run["args"] or "{}")
+                selected = None
+                if run_args.get("rules"):
+                    rule_tuple = tuple(map(int, run_args["rules"].split(",")))
+                    selected = {row["name"].lower() for row in connection.execute(f"SELECT name FROM shard.lint_rule WHERE id IN ({','.join('?' * len(rule_tuple))})", rule_tuple)}
+                for row in connection.execute("SELECT DISTINCT app FROM shard.scan_stage WHERE run = ? AND stage = 'write' AND error IS NULL", (run["id"],)):
+                    if row["app"] not in app_ids:
+                        continue
+                    main_fingerprints = fingerprints["main"].get(app_ids[row["app"]], {})
+                    # the rules whose fingerprint the write changed, forced reanalysis (--analyze) rewrites the selected rules without changing their fingerprints
+                    changed.setdefault(row["app"], set()).update(
+                        rule for rule, fingerprint in fingerprints["shard"].get(row["app"], {}).items()
+                        if (selected is None or rule.lower() in selected) and (run_args.get("force_analyze") or main_fingerprints.get(rule) != fingerprint)
+                    )
+
+            added = deleted = apps = 0
+            for shard_app_id, changed_rules in changed.items():
+                if not changed_rules:
+                    continue
+                app_id = app_ids[shard_app_id]
+                rules = {rule.lower() for rule in changed_rules}
+                shard_findings = finding_keys(connection, "shard", shard_app_id, rules)
+                main_findings = finding_keys(connection, "main", app_id, rules)
+                shard_keys = Counter(key for _, _, key in shard_findings)
+                main_keys = Counter(key for _, _, key in main_findings)
+                stale = [(finding_id,) for finding_id, vulnerable, key in main_findings if vulnerable is None and key not in shard_keys]
+                connection.executemany("DELETE FROM main.finding WHERE id = ?", stale)
+                missing = []
+                for _, vulnerable, key in shard_findings:
+                    if main_keys[key] > 0:
+                        main_keys[key] -= 1
+                    elif key[0] in lint_rule_ids:
+                        missing.append((vulnerable, key))
+                file_ids = save_finding_files(connection, app_id, {key[1] for _, key in missing if key[1] is not None})
+                connection.executemany(
+                    'INSERT INTO main.finding (vulnerable, description, file, "offset", "length", line, "column", end_line, end_column, app, lint_rule) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(vulnerable, description, file_ids.get(path), *location, app_id, lint_rule_ids[rule]) for vulnerable, (rule, path, *location, description) in missing]
+                )
+                connection.executemany(
+                    "REPLACE INTO main.analysis_fingerprint (app, lint_rule, fingerprint) VALUES (?, ?, ?)", [(app_id, rule, fingerprints["shard"][shard_app_id][rule]) for rule in changed_rules]
+                )
+                connection.execute(
+                    "UPDATE main.app SET commit_sha = (SELECT commit_sha FROM shard.app WHERE id = ?), analyzed = TRUE WHERE id = ?", (shard_app_id, app_id)
+                )
+                refresh_summaries(connection, app_id)
+                added += len(missing)
+                deleted += len(stale)
+                apps += 1
+
+            for run in runs:
+                run_id = connection.execute(
+                    "INSERT INTO main.scan_run (started_at, finished_at, jobs, args) VALUES (?, ?, ?, ?)", (run["started_at"], run["finished_at"], run["jobs"], run["args"])
+                ).lastrowid
+                connection.executemany(
+                    "INSERT INTO main.scan_stage (run, app, stage, started_at, duration, cpu_user, cpu_system, max_rss, bytes, detail, findings, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (run_id, app_ids[stage["app"]], stage["stage"], stage["started_at"], stage["duration"], stage["cpu_user"], stage["cpu_system"], stage["max_rss"], stage["bytes"], stage["detail"], stage["findings"], stage["error"])
+                        for stage in connection.execute("SELECT * FROM shard.scan_stage WHERE run = ?", (run["id"],)) if stage["app"] in app_ids
+                    ]
+                )
+    finally:
+        connection.execute("DETACH DATABASE shard")
+    print(f"{path}: {apps} apps reanalyzed, {added} findings added, {deleted} replaced findings deleted, {len(runs)} scan runs")
+
+def print_report(connection: sqlite3.Connection, run_id: int, limit: int):
+    run = connection.execute("SELECT * FROM scan_run WHERE id = ?", (run_id,)).fetchone() if run_id else connection.execute("SELECT * FROM scan_run ORDER BY id DESC LIMIT 1").fetchone()
+    if not run:
+        print("no scan run recorded")
+        return
+    stages = connection.execute("SELECT scan_stage.*, app.github_name FROM scan_stage JOIN app ON scan_stage.app = app.id WHERE run = ?", (run["id"],)).fetchall()
+    wall = (run["finished_at"] or max((stage["started_at"] + stage["duration"] for stage in stages), default=run["started_at"])) - run["started_at"]
+    print(f"run {run['id']}: {len({stage['app'] for stage in stages})} apps, {wall:.0f}s wall clock, {run['jobs']} jobs{'' if run['finished_at'] else ', unfinished'}")
+
+    print(f"\n{'stage':<10}{'count':>7}{'errors':>8}{'total s':>10}{'mean s':>9}{'p95 s':>9}{'cpu s':>10}{'max rss MiB':>13}{'MiB fetched':>13}{'findings':>10}")
+    for name in ("clone", "clean", "workspace", "pub_get", "analyze", "write"):
+        rows = [stage for stage in stages if stage["stage"] == name]
+        if not rows:
+            continue
+        durations = sorted(stage["duration"] for stage in rows)
+        print(
+            f"{name:<10}{len(rows):>7}{sum(1 for stage in rows if stage['error']):>8}{sum(durations):>10.0f}{sum(durations) / len(rows):>9.1f}"
+            f"{durations[min(len(rows) - 1, int(len(rows) * 0.95))]:>9.1f}{sum(stage['cpu_user'] + stage['cpu_system'] for stage in rows):>10.0f}"
+            f"{max(stage['max_rss'] or 0 for stage in rows) / 1024:>13.0f}{sum(stage['bytes'] or 0 for stage in rows) / (1 << 20):>13.1f}{sum(stage['findings'] or 0 for stage in rows):>10}"
+        )
+
+    apps = {}
+    for stage in stages:
+        apps.setdefault((stage["app"], stage["github_name"]), []).append(stage)
+    print(f"\nslowest apps:")
+    for (app_id, name), rows in sorted(apps.items(), key=lambda item: -sum(stage["duration"] for stage in item[1]))[:limit]:
+        slowest = max(rows, key=lambda stage: stage["duration"])
+        print(f"  {sum(stage['duration'] for stage in rows):>8.1f}s  app {app_id} {name}  (slowest stage: {slowest['stage']} {slowest['duration']:.1f}s{', failed' if any(stage['error'] for stage in rows) else ''})")
+
+    print(f"\nslowest stages:")
+    for stage in sorted(stages, key=lambda stage: -stage["duration"])[:limit]:
+        print(f"  {stage['duration']:>8.1f}s  {stage['stage']:<8} app {stage['app']} {stage['github_name']}  {stage['detail'] or ''}")
+
+    combinations = {}
+    for stage in stages:
+        if stage["stage"] == "pub_get":
+            combinations.setdefault(stage["detail"] or "failed", []).append(stage["duration"])
+    print(f"\npub get combinations:")
+    for detail, durations in sorted(combinations.items(), key=lambda item: -len(item[1])):
+        print(f"  {len(durations):>6} apps  {sum(durations) / len(durations):>6.1f}s mean  {detail}")
+
+def print_summary(connection: sqlite3.Connection):
+    start = perf_counter()
+    analyzed, playstore = connection.execute("SELECT count(*), count(playstore_url) FROM app WHERE analyzed").fetchone()
+    print(f"analyzed apps: {analyzed}, on the Play Store: {playstore}")
+    for title, table, column, names in (
+        ("lint rule", "app_rule_summary", "lint_rule", "lint_rule"),
+        ("risk", "app_risk_summary", "risk", "common_risk"),
+        ("MASVS category", "app_category_summary", "masvs_category", "masvs_category"),
+    ):
+        print(f"\n{title:<45}{'apps':>8}{'play apps':>11}{'findings':>10}{'play findings':>15}{'vulnerable':>12}")
+        rows = connection.execute(f"""
+            SELECT {names}.name, count(*) AS apps, count(app.playstore_url) AS playstore_apps, sum(findings) AS findings,
+                sum(findings) FILTER (WHERE app.playstore_url IS NOT NULL) AS playstore_findings, sum(vulnerable) AS vulnerable
+            FROM {table} JOIN app ON {table}.app = app.id JOIN {names} ON {table}.{column} = {names}.id
+            GROUP BY {table}.{column} ORDER BY apps DESC, findings DESC
+            """)
+        for row in rows:
+            print(f"{row['name'][:44]:<45}{row['apps']:>8}{row['playstore_apps']:>11}{row['findings']:>10}{row['playstore_findings'] or 0:>15}{row['vulnerable']:>12}")
+    print(f"\n{(perf_counter() - start) * 1000:.1f}ms")
 
-        
 def main():
     argparser = ArgumentParser()
     argparser.add_argument("config")
     argparser.add_argument("--clone", dest="force_clone", action=BooleanOptionalAction, help="force reclone of all apps")
-    argparser.add_argument("--analyze", dest="force_analyze", action=BooleanOptionalAction, help="force reanalysis of all apps")
-    argparser.add_argument("--delete-findings", dest="delete_findings", action=BooleanOptionalAction, help="delete old findings before analysis")
+    argparser.add_argument("--analyze", dest="force_analyze", action=BooleanOptionalAction, help="force reanalysis of all apps, otherwise only rules whose fingerprint (commit, lint rule sources) changed are rerun")
+    argparser.add_argument("--delete-findings", dest="delete_findings", action=BooleanOptionalAction, help="no effect, kept for existing invocations: the unconfirmed findings of reanalyzed rules are always replaced")
     argparser.add_argument("-r", "--rules", type=str, default="", help="comma-separated list of lint_rule IDs from attached database. analysis will be limited to those rules")
     argparser.add_argument("-l", "--limit", type=int, default=-1, help="limit the number of apps to analyze, ordered by github_stars")
+    argparser.add_argument("-j", "--jobs", type=int, default=1, help="number of apps to clone, setup and analyze in parallel")
+    argparser.add_argument("--daemon", action=BooleanOptionalAction, help="analyze apps with long-lived lint daemons (one per job) instead of one `dart run custom_lint` per app")
+    argparser.add_argument("--summary", action="store_true", help="print apps and findings per lint rule, risk and MASVS category from the summary tables instead of scanning")
+    argparser.add_argument("--refresh-summary", action="store_true", help="rebuild the summary tables from the finding table instead of scanning, e.g. after findings were edited by hand")
+    argparser.add_argument("--report", type=int, nargs="?", const=0, help="print the stage metrics of a scan run (default: the latest) instead of scanning, --limit sets the number of slowest apps and stages shown")
+    argparser.add_argument("--shard", type=shard, help="only scan the apps with id %% N == i, for splitting a scan over N hosts")
+    argparser.add_argument("--queue", help="claim apps one at a time from the work_lease table of this shared database instead of scanning a fixed selection")
+    argparser.add_argument("--lease", type=float, default=600, help="seconds until an app claimed from --queue by a worker that stopped renewing it is claimed again")
+    argparser.add_argument("--output", help="write the results to this database instead of the configured one, created as a copy of it. folded back in with --merge")
+    argparser.add_argument("--merge", nargs="+", metavar="DATABASE", help="merge the results of --output databases into the configured database instead of scanning")
     args = argparser.parse_args()
 
     with open(args.config) as f:
@@ -193,15 +1038,43 @@ def main():
         config = {k: realpath(v, strict=True) for k, v in config.items()}
 
     config["thesis_lints_dir"] = realpath(f"{dirname(__file__)}/thesis_lints", strict=True)
-    connection = sqlite3.connect(config["database"], autocommit=True)
+    if args.output and not isfile(args.output):
+        # workers of a shard or queue start from the apps, lint rules and fingerprints of the configured database
+        source, output = sqlite3.connect(config["database"]), sqlite3.connect(args.output)
+        source.backup(output)
+        source.close()
+        output.close()
+    connection = sqlite3.connect(args.output or config["database"], autocommit=True)
     connection.row_factory = sqlite3.Row
+    if args.queue and realpath(args.queue) == realpath(args.output or config["database"]):
+        # shared with the workers of other hosts, see WorkQueue
+        connection.execute("PRAGMA journal_mode = DELETE")
+    else:
+        # WAL with synchronous=NORMAL only syncs on checkpoints instead of on every commit
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
     with open("create_db.sql") as f:
         create_db_script = f.read()
+    migrate_finding_locations(connection, create_db_script)
     connection.executescript(create_db_script)
+    # databases from before the summary tables, or with hand-edited findings
+    if args.refresh_summary or (connection.execute("SELECT 1 FROM finding WHERE lint_rule IS NOT NULL LIMIT 1").fetchone() and not connection.execute("SELECT 1 FROM app_rule_summary LIMIT 1").fetchone()):
+        with transaction(connection):
+            refresh_summaries(connection)
 
-    os.environ["GIT_TERMINAL_PROMPT"] = "0"
-
-    download_analyze_apps(connection, config, args)
+    if args.summary:
+        print_summary(connection)
+    elif args.report is not None:
+        print_report(connection, args.report, args.limit if args.limit > 0 else 10)
+    elif args.merge:
+        for path in args.merge:
+            merge_database(connection, path)
+    elif not args.refresh_summary:
+        os.environ["GIT_TERMINAL_PROMPT"] = "0"
+        queue = WorkQueue(args.queue, create_db_script, args.lease) if args.queue else None
+        download_analyze_apps(connection, config, args, queue)
+        if queue:
+            queue.close()
 
     connection.close()
 
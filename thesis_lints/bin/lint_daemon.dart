@@ -0,0 +1,92 @@
+import 'dart:convert';
+import 'dart:io';
+
+import 'package:analyzer/dart/analysis/analysis_context_collection.dart';
+import 'package:analyzer/dart/analysis/results.dart';
+import 'package:analyzer/error/error.dart';
+import 'package:thesis_lints/thesis_lints.dart';
+
+// Long-lived analysis process, started once by reposcanner.py instead of one `dart run custom_lint` per app.
+// Writes {"ready": true} once started, `dart run` may have printed build output to stdout before.
+// Reads one request per line from stdin: {"directory": "/path/to/app", "rules": ["lint_name", ...] or null}
+// Writes one response per line to stdout in the format of `custom_lint --format=json`, or {"error": "..."}
+Future<void> main() async {
+  stdout.writeln(jsonEncode({'ready': true}));
+  await for (final line in stdin.transform(utf8.decoder).transform(const LineSplitter())) {
+    if (line.trim().isEmpty) continue;
+    try {
+      final request = jsonDecode(line) as Map<String, dynamic>;
+      final rules = (request['rules'] as List?)?.cast<String>();
+      final diagnostics = await analyze(request['directory'] as String, rules);
+      stdout.writeln(jsonEncode({'version': 1, 'diagnostics': diagnostics}));
+    } catch (e) {
+      stdout.writeln(jsonEncode({'version': 1, 'error': e.toString()}));
+    }
+  }
+}
+
+Future<List<Map<String, dynamic>>> analyze(String directory, List<String>? rules) async {
+  final enabledRules = rules?.map((rule) => rule.toLowerCase()).toSet();
+  final enabledLints = lints.where((lint) => enabledRules == null || enabledRules.contains(lint.code.name.toLowerCase())).toList();
+  final collection = AnalysisContextCollection(includedPaths: [Directory(directory).absolute.path]);
+  final diagnostics = <Map<String, dynamic>>[];
+  try {
+    for (final context in collection.contexts) {
+      // analyzedFiles() respects the analyzer.exclude globs written by setup_analyzer
+      for (final path in context.contextRoot.analyzedFiles()) {
+        if (!path.endsWith('.dart')) continue;
+        final result = await context.currentSession.getResolvedUnit(path);
+        if (result is! ResolvedUnitResult) continue;
+        for (final lint in enabledLints) {
+          for (final error in await lint.testRun(result)) {
+            // testRun skips the ignore comments that custom_lint applies
+            if (_isIgnored(error, result)) continue;
+            diagnostics.add(_diagnosticToJson(error, result));
+          }
+        }
+      }
+    }
+  } finally {
+    await collection.dispose();
+  }
+  return diagnostics;
+}
+
+final _ignoreForFile = RegExp(r'//\s*ignore_for_file\s*:(.*)');
+final _ignore = RegExp(r'//\s*ignore\s*:(.*)');
+
+Set<String> _ignoredCodes(Iterable<RegExpMatch> matches) =>
+    {for (final match in matches) ...match.group(1)!.split(',').map((code) => code.trim().toLowerCase())};
+
+// `// ignore_for_file: code` anywhere in the file, `// ignore: code` at the end of the line or on the line before, like custom_lint
+bool _isIgnored(AnalysisError error, ResolvedUnitResult result) {
+  final code = error.errorCode.name.toLowerCase();
+  if (_ignoredCodes(_ignoreForFile.allMatches(result.content)).contains(code)) return true;
+  final lineInfo = result.lineInfo;
+  final line = lineInfo.getLocation(error.offset).lineNumber - 1;
+  for (final index in [line, line - 1]) {
+    if (index < 0) continue;
+    final end = index + 1 < lineInfo.lineCount ? lineInfo.getOffsetOfLine(index + 1) : result.content.length;
+    final text = result.content.substring(lineInfo.getOffsetOfLine(index), end);
+    if (_ignoredCodes(_ignore.allMatches(text)).contains(code)) return true;
+  }
+  return false;
+}
+
+Map<String, dynamic> _diagnosticToJson(AnalysisError error, ResolvedUnitResult result) {
+  final start = result.lineInfo.getLocation(error.offset);
+  final end = result.lineInfo.getLocation(error.offset + error.length);
+  return {
+    'code': error.errorCode.name.toLowerCase(),
+    'severity': error.errorCode.errorSeverity.name,
+    'type': error.errorCode.type.name,
+    'location': {
+      'file': error.source.fullName,
+      'range': {
+        'start': {'offset': error.offset, 'line': start.lineNumber, 'column': start.columnNumber},
+        'end': {'offset': error.offset + error.length, 'line': end.lineNumber, 'column': end.columnNumber},
+      },
+    },
+    'problemMessage': error.message,
+  };
+}
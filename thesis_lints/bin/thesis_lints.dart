@@ -1,7 +1,8 @@
+import 'dart:convert';
 
 import 'package:thesis_lints/thesis_lints.dart';
 
 void main() {
-  var lint_names = lints.map((lint) => lint.code.name);
-  print(lint_names);
-}
\ No newline at end of file
+  var lint_names = lints.map((lint) => lint.code.name).toList();
+  print(jsonEncode(lint_names));
+}